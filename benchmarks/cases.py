@@ -0,0 +1,270 @@
+"""Benchmark cases extracted from the lecture pipelines.
+
+Each case has a `setup(scale)` function building its inputs, with `scale`
+times the pixels of the lecture's own inputs, and a `run(*inputs)` function
+executing the pipeline as the lecture does. Stages inside `run` are marked
+with `skdemo.profile`, so the runner can report where time and memory go.
+
+Inputs are built from the bundled `images/` (tiled with mirrored copies, so
+no seams appear, or upsampled where tiling would break the pipeline) or are
+synthetic when the lecture data are not in the repository.
+"""
+from __future__ import division
+
+import os
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from skimage import io
+
+from skdemo import profile
+
+
+IMAGES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'images')
+
+Case = namedtuple('Case', ['name', 'setup', 'run', 'description'])
+
+CASES = OrderedDict()
+
+
+def case(name, setup):
+    """Register the decorated function as the `run` of a case."""
+    def register(run):
+        CASES[name] = Case(name, setup, run, (run.__doc__ or '').strip())
+        return run
+    return register
+
+
+def linear_factor(scale):
+    """Side-length factor giving `scale` times the pixels."""
+    factor = int(round(np.sqrt(scale)))
+    if factor ** 2 != scale:
+        raise ValueError('Scale must be a square number, got {}'.format(scale))
+    return factor
+
+
+def mirror_tile(image, factor):
+    """ Tile `image` `factor` times along its first two axes.
+
+    Every other tile is flipped so that neighbouring tiles meet at equal
+    edges, and no artificial edges are added to the image.
+    """
+    rows = [image if i % 2 == 0 else image[::-1] for i in range(factor)]
+    column = np.concatenate(rows, axis=0)
+    cols = [column if j % 2 == 0 else column[:, ::-1] for j in range(factor)]
+    return np.ascontiguousarray(np.concatenate(cols, axis=1))
+
+
+def _imread(*path):
+    return io.imread(os.path.join(IMAGES, *path))
+
+
+def _remove_small_objects(binary, min_size):
+    """Remove objects smaller than `min_size` with any scikit-image."""
+    from skimage import morphology
+
+    try:
+        # scikit-image >= 0.26 removes objects of at most `max_size`
+        return morphology.remove_small_objects(binary, max_size=min_size - 1)
+    except TypeError:
+        return morphology.remove_small_objects(binary, min_size=min_size)
+
+
+# Panorama stitching: ORB keypoints, matching and RANSAC
+# (adv3_panorama-stitching)
+
+def setup_panorama(scale):
+    from skimage.color import rgb2gray
+    from skimage.transform import rescale
+
+    names = ['JDW_0302.jpg', 'JDW_0303.jpg', 'JDW_0304.jpg']
+    frames = [rgb2gray(_imread('pano', name)) for name in names]
+    factor = linear_factor(scale)
+    if factor > 1:
+        # Tiling would repeat every keypoint; upsample the frames instead
+        frames = [rescale(frame, factor, order=1, mode='reflect')
+                  for frame in frames]
+    return frames
+
+
+@case('panorama', setup_panorama)
+def run_panorama(pano0, pano1, pano2):
+    """ORB+RANSAC registration of three panorama frames."""
+    from skimage.feature import ORB, match_descriptors
+    from skimage.measure import ransac
+    from skimage.transform import ProjectiveTransform
+
+    keypoints, descriptors = [], []
+    with profile('orb'):
+        orb = ORB(n_keypoints=800, fast_threshold=0.05)
+        for frame in (pano0, pano1, pano2):
+            orb.detect_and_extract(frame)
+            keypoints.append(orb.keypoints)
+            descriptors.append(orb.descriptors)
+
+    with profile('match'):
+        matches01 = match_descriptors(descriptors[0], descriptors[1],
+                                      cross_check=True)
+        matches12 = match_descriptors(descriptors[1], descriptors[2],
+                                      cross_check=True)
+
+    np.random.seed(0)
+    with profile('ransac'):
+        src = keypoints[0][matches01[:, 0]][:, ::-1]
+        dst = keypoints[1][matches01[:, 1]][:, ::-1]
+        model01, inliers01 = ransac((src, dst), ProjectiveTransform,
+                                    min_samples=4, residual_threshold=1,
+                                    max_trials=300)
+        src = keypoints[2][matches12[:, 1]][:, ::-1]
+        dst = keypoints[1][matches12[:, 0]][:, ::-1]
+        model12, inliers12 = ransac((src, dst), ProjectiveTransform,
+                                    min_samples=4, residual_threshold=1,
+                                    max_trials=300)
+    return model01, model12
+
+
+# Trainable segmentation: random forest on RGB features (machine_learning)
+
+def setup_trainable_segmentation(scale):
+    beach = _imread('Bells-Beach.jpg')
+    mask = np.zeros(beach.shape[0:2], dtype=np.uint8)
+    mask[700:, 350:650] = 1
+    mask[100:500, 350:650] = 2
+    mask[400:450, 1000:1100] = 3
+    factor = linear_factor(scale)
+    return mirror_tile(beach, factor), mirror_tile(mask, factor)
+
+
+@case('trainable_segmentation', setup_trainable_segmentation)
+def run_trainable_segmentation(im_features, mask):
+    """Random forest trained on labelled pixels, predicted on all pixels."""
+    from sklearn.ensemble import RandomForestClassifier
+
+    im_features = np.atleast_3d(im_features)
+    nb_row, nb_col, nb_features = im_features.shape
+
+    with profile('train'):
+        training_data = im_features[mask > 0, :]
+        training_labels = mask[mask > 0].ravel()
+        # The number of trees is fixed: the default changed between
+        # scikit-learn versions, which would show up as a regression.
+        clf = RandomForestClassifier(n_estimators=10, random_state=0)
+        clf.fit(training_data, training_labels)
+
+    with profile('predict'):
+        labels = clf.predict(im_features.reshape(nb_row * nb_col,
+                                                 nb_features))
+    return labels.reshape(mask.shape)
+
+
+# 3D watershed of touching cells (three_dimensional_image_processing)
+
+def setup_watershed_3d(scale):
+    from scipy import ndimage as ndi
+    from skimage import data
+
+    # The lecture's cells.tif is not bundled: use smoothed 3D blobs with a
+    # similar shape, (60, 256, 256) voxels at scale 1.
+    blobs = data.binary_blobs(length=256, blob_size_fraction=0.08, n_dim=3,
+                              volume_fraction=0.3, rng=0)[:60]
+    volume = ndi.gaussian_filter(blobs.astype(np.float32), 2)
+    volume = volume / volume.max()
+    factor = linear_factor(scale)
+    return mirror_tile(volume.transpose(1, 2, 0), factor).transpose(2, 0, 1),
+
+
+@case('watershed_3d', setup_watershed_3d)
+def run_watershed_3d(rescaled):
+    """Thresholding, distance-transform markers and 3D watershed."""
+    from scipy import ndimage as ndi
+    from skimage import feature, filters, measure, segmentation
+
+    with profile('threshold'):
+        denoised = ndi.median_filter(rescaled, size=3)
+        binary = denoised >= filters.threshold_li(denoised)
+        binary = _remove_small_objects(binary, min_size=200)
+
+    with profile('markers'):
+        distance = ndi.distance_transform_edt(binary)
+        peaks = feature.peak_local_max(
+            distance, footprint=np.ones((15, 15, 15), dtype=bool),
+            labels=measure.label(binary))
+        peak_mask = np.zeros(distance.shape, dtype=bool)
+        peak_mask[tuple(peaks.T)] = True
+        markers = measure.label(peak_mask)
+
+    with profile('watershed'):
+        labels = segmentation.watershed(-rescaled, markers, mask=binary)
+    return labels
+
+
+# Microarray grid ratio (adv2_microarray)
+
+def setup_microarray(scale):
+    from skimage import img_as_float
+
+    microarray = img_as_float(_imread('microarray.jpg'))
+    return mirror_tile(microarray, linear_factor(scale)),
+
+
+@case('microarray', setup_microarray)
+def run_microarray(microarray):
+    """Grid location from intensity profiles and per-spot red/green ratio."""
+    from skimage import feature
+
+    red = microarray[..., 0]
+    green = microarray[..., 1]
+
+    with profile('grid'):
+        both = green + red
+        sum_down_columns = both.sum(axis=0)
+        sum_across_rows = both.sum(axis=1)
+        dips_columns = feature.peak_local_max(
+            sum_down_columns.max() - sum_down_columns).ravel()
+        dips_rows = feature.peak_local_max(
+            sum_across_rows.max() - sum_across_rows).ravel()
+        dips_columns.sort()
+        dips_rows.sort()
+
+    with profile('ratio'), np.errstate(divide='ignore', invalid='ignore'):
+        out = np.zeros(microarray.shape[:2])
+        for i in range(len(dips_rows) - 1):
+            for j in range(len(dips_columns) - 1):
+                row0, row1 = dips_rows[i], dips_rows[i + 1]
+                col0, col1 = dips_columns[j], dips_columns[j + 1]
+
+                ratio = red[row0:row1, col0:col1] / green[row0:row1, col0:col1]
+                mask = ~np.isinf(ratio)
+
+                mean_ratio = np.mean(ratio[mask]) if mask.any() else 0
+                if np.isnan(mean_ratio):
+                    mean_ratio = 0
+                out[row0:row1, col0:col1] = mean_ratio
+    return out
+
+
+# Hough circles (2_feature_detection)
+
+def setup_hough_circles(scale):
+    from skimage import data
+
+    image = data.coins()[0:95, 180:370]
+    return mirror_tile(image, linear_factor(scale)),
+
+
+@case('hough_circles', setup_hough_circles)
+def run_hough_circles(image):
+    """Canny edges, circular Hough transform and peak extraction."""
+    from skimage.feature import canny
+    from skimage.transform import hough_circle, hough_circle_peaks
+
+    with profile('canny'):
+        edges = canny(image, sigma=3, low_threshold=10, high_threshold=60)
+    with profile('hough'):
+        hough_radii = np.arange(15, 30, 2)
+        hough_response = hough_circle(edges, hough_radii)
+    with profile('peaks'):
+        peaks = hough_circle_peaks(hough_response, hough_radii,
+                                   min_xdistance=10, min_ydistance=10)
+    return peaks
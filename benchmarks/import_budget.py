@@ -0,0 +1,82 @@
+"""Check that ``import skdemo`` stays cheap.
+
+The package loads its submodules lazily, so importing it must neither take
+long nor pull in the heavy dependencies of the plotting helpers. Each
+import runs in a fresh interpreter; the reported time is the best of
+`--repeat` imports, excluding NumPy, which is imported first as every
+lecture does anyway. The exit status is 1 if the time exceeds the budget
+or a forbidden package was imported::
+
+    python benchmarks/import_budget.py --budget 0.02
+"""
+from __future__ import division, print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LECTURES = os.path.join(os.path.dirname(HERE), 'lectures')
+
+FORBIDDEN = ['matplotlib', 'skimage']
+
+_PROBE = """
+import json, sys, time
+import numpy
+start = time.perf_counter()
+import skdemo
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds,
+                  'modules': sorted(set(m.split('.')[0]
+                                        for m in sys.modules))}))
+"""
+
+
+def measure_import():
+    """Time of ``import skdemo`` in a fresh interpreter, and its modules."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [LECTURES] + [p for p in [env.get('PYTHONPATH')] if p])
+    # The probe must not import anything behind our back at start-up
+    env.pop('SKDEMO_PROFILE', None)
+    output = subprocess.check_output([sys.executable, '-c', _PROBE], env=env,
+                                     universal_newlines=True)
+    result = json.loads(output.strip().splitlines()[-1])
+    return result['seconds'], result['modules']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check the import time of skdemo.')
+    parser.add_argument('--budget', type=float, default=0.05,
+                        help='allowed import time in seconds '
+                             '(default: 0.05)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='imports to take the best time of')
+    args = parser.parse_args(argv)
+
+    times = []
+    loaded = set()
+    for _ in range(args.repeat):
+        seconds, modules = measure_import()
+        times.append(seconds)
+        loaded.update(m for m in modules if m in FORBIDDEN)
+
+    best = min(times)
+    failed = False
+    status = 'ok' if best <= args.budget else 'OVER BUDGET'
+    failed |= best > args.budget
+    print('import skdemo: {:.1f} ms (budget {:.1f} ms) {}'.format(
+        best * 1e3, args.budget * 1e3, status))
+    for name in FORBIDDEN:
+        imported = name in loaded
+        failed |= imported
+        print('  {:<12} {}'.format(name, 'IMPORTED' if imported
+                                   else 'not imported'))
+    return int(failed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Run the lecture benchmarks and compare them with a stored baseline.
+
+Examples
+--------
+Record a baseline, then check a library upgrade or refactor against it::
+
+    python benchmarks/run.py --output baseline.json
+    ...
+    python benchmarks/run.py --output new.json --compare baseline.json
+
+Each case runs at every scale (times the pixels of the lecture inputs).
+After a warm-up run, the reported time is the best of `--repeat` runs
+without memory tracing; a separate traced run records the peak memory of
+the whole case and of its stages. With `--compare`, the exit status is 1
+if any case got slower or used more memory than the baseline by more than
+the thresholds.
+"""
+from __future__ import division, print_function
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import time
+from collections import OrderedDict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'lectures'))
+sys.path.insert(0, HERE)
+
+import skdemo                 # noqa: E402
+from cases import CASES       # noqa: E402
+
+
+PACKAGES = ['numpy', 'scipy', 'skimage', 'sklearn', 'matplotlib']
+
+
+def _versions():
+    versions = OrderedDict()
+    for name in PACKAGES:
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            versions[name] = None
+    return versions
+
+
+def _shapes(inputs):
+    return [list(getattr(x, 'shape', ())) for x in inputs]
+
+
+def run_case(case, scale, repeat=3):
+    """ Time and trace one case at one scale.
+
+    Returns
+    -------
+    result : dict
+        Best and individual wall times, peak traced memory of the case and
+        the per-stage records of `skdemo.profile_report`.
+    """
+    inputs = case.setup(scale)
+    # Warm up: lazy imports and first-call caches are not measured
+    case.run(*inputs)
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        case.run(*inputs)
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    skdemo.reset_profile()
+    skdemo.enable_profiling(memory=True)
+    try:
+        with skdemo.profile(case.name):
+            case.run(*inputs)
+    finally:
+        skdemo.disable_profiling()
+    stages = skdemo.profile_report(format='records')
+    skdemo.reset_profile()
+
+    return OrderedDict([('case', case.name),
+                        ('scale', scale),
+                        ('input_shapes', _shapes(inputs)),
+                        ('time_s', min(times)),
+                        ('times_s', times),
+                        ('peak_bytes', stages[0]['peak_bytes']),
+                        ('stages', stages)])
+
+
+def run_all(names, scales, repeat=3, verbose=True):
+    results = []
+    for name in names:
+        for scale in scales:
+            result = run_case(CASES[name], scale, repeat=repeat)
+            if verbose:
+                print('{:<24} {:>4}x {:>10.3f} s {:>10.1f} MB'.format(
+                    name, scale, result['time_s'],
+                    result['peak_bytes'] / 2**20))
+                sys.stdout.flush()
+            results.append(result)
+    return OrderedDict([
+        ('meta', OrderedDict([
+            ('date', datetime.datetime.now().isoformat()),
+            ('python', platform.python_version()),
+            ('platform', platform.platform()),
+            ('machine', platform.machine()),
+            ('repeat', repeat),
+            ('versions', _versions())])),
+        ('results', results)])
+
+
+def compare(current, baseline, time_threshold=0.2, memory_threshold=0.2):
+    """ Compare two benchmark results.
+
+    Parameters
+    ----------
+    current, baseline : dict
+        Benchmark results as written by this script.
+    time_threshold, memory_threshold : float
+        Allowed relative increase of time and peak memory, e.g. 0.2 for
+        20%.
+
+    Returns
+    -------
+    rows : list of dict
+        One row per case and scale present in both results, with the
+        ratios to the baseline and a `regression` flag.
+    """
+    reference = dict(((r['case'], r['scale']), r)
+                     for r in baseline['results'])
+    rows = []
+    for result in current['results']:
+        base = reference.get((result['case'], result['scale']))
+        if base is None:
+            continue
+        time_ratio = result['time_s'] / base['time_s']
+        memory_ratio = (result['peak_bytes'] / base['peak_bytes']
+                        if base['peak_bytes'] else 1.)
+        slower = time_ratio > 1 + time_threshold
+        bigger = memory_ratio > 1 + memory_threshold
+        rows.append(OrderedDict([('case', result['case']),
+                                 ('scale', result['scale']),
+                                 ('time_ratio', time_ratio),
+                                 ('memory_ratio', memory_ratio),
+                                 ('slower', slower),
+                                 ('bigger', bigger),
+                                 ('regression', slower or bigger)]))
+    return rows
+
+
+def format_comparison(rows):
+    header = '{:<24} {:>5} {:>8} {:>8}  {}'.format(
+        'case', 'scale', 'time', 'memory', 'status')
+    lines = [header, '-' * len(header)]
+    for row in rows:
+        status = []
+        if row['slower']:
+            status.append('SLOWER')
+        if row['bigger']:
+            status.append('MORE MEMORY')
+        lines.append('{:<24} {:>4}x {:>7.2f}x {:>7.2f}x  {}'.format(
+            row['case'], row['scale'], row['time_ratio'],
+            row['memory_ratio'], ', '.join(status) or 'ok'))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the lecture pipelines.')
+    parser.add_argument('cases', nargs='*', metavar='case',
+                        help='cases to run (default: all of {})'.format(
+                            ', '.join(CASES)))
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 4, 16],
+                        help='input scales, in times the pixels of the '
+                             'lecture inputs (square numbers)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timed runs per case and scale')
+    parser.add_argument('-o', '--output', help='write the results to a JSON '
+                                               'file')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='JSON results to compare with')
+    parser.add_argument('--time-threshold', type=float, default=0.2,
+                        help='allowed relative slowdown (default: 0.2)')
+    parser.add_argument('--memory-threshold', type=float, default=0.2,
+                        help='allowed relative increase of peak memory '
+                             '(default: 0.2)')
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        parser.error('unknown case(s): {}'.format(', '.join(unknown)))
+
+    current = run_all(args.cases or list(CASES), args.scales,
+                      repeat=args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(current, baseline, args.time_threshold,
+                       args.memory_threshold)
+        print()
+        print(format_comparison(rows))
+        if any(row['regression'] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,16 @@
+"""Check that the packages of requirements.txt are installed.
+
+Versions are read from the installed package metadata, so nothing is
+imported. With --import-profile, each package is also imported in a fresh
+interpreter and its import time is broken down by the top-level packages it
+pulls in (as reported by ``python -X importtime``).
+"""
+import argparse
+import functools
+import re
+import subprocess
 import sys
-from distutils.version import LooseVersion
+from collections import defaultdict
 
 if sys.version_info.major < 3:
     print('[!] You are running an old version of Python. '
@@ -7,36 +18,133 @@ if sys.version_info.major < 3:
 
     sys.exit(1)
 
-with open('requirements.txt') as f:
-    reqs = f.readlines()
+from importlib import metadata
 
-reqs = [(pkg, ver) for (pkg, _, ver) in
-        (req.split() for req in reqs if req.strip())]
 
 pkg_names = {
     'scikit-image': 'skimage',
     'scikit-learn': 'sklearn'
 }
 
-for (pkg, version_wanted) in reqs:
-    module_name = pkg_names.get(pkg, pkg)
+
+def read_requirements(filename='requirements.txt'):
+    with open(filename) as f:
+        reqs = f.readlines()
+    return [(pkg, ver) for (pkg, _, ver) in
+            (req.split() for req in reqs if req.strip())]
+
+
+def version_tuple(version):
+    """Leading numeric release of a version string, e.g. (0, 19, 1)."""
+    match = re.match(r'\d+(\.\d+)*', version)
+    return tuple(int(n) for n in match.group().split('.')) if match else ()
+
+
+def installed_version(pkg):
     try:
-        m = __import__(module_name)
+        return metadata.version(pkg)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def needs_numpy(pkg):
+    """Whether `pkg` requires NumPy and NumPy is missing."""
+    if pkg == 'numpy' or installed_version('numpy') is not None:
+        return False
+    requires = metadata.requires(pkg) or []
+    return any(re.match(r'numpy\b', req) for req in requires)
+
+
+def _import_times(code):
+    """Parse ``-X importtime`` of `code`: [(self_s, cumulative_s, name)]."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    if proc.returncode != 0:
+        lines = [line for line in proc.stderr.strip().splitlines()
+                 if not line.startswith('import time:')]
+        raise ImportError(lines[-1] if lines else 'child exited with status '
+                          '{}'.format(proc.returncode))
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times.append((int(self_us) / 1e6, int(cumulative_us) / 1e6,
+                      name.strip()))
+    return times
+
+
+@functools.lru_cache()
+def _startup_modules():
+    return frozenset(name for _, _, name in _import_times('pass'))
+
+
+def import_profile(module_name):
+    """ Import `module_name` in a fresh interpreter and time it.
+
+    Returns
+    -------
+    total : float
+        Cumulative import time of the module, in seconds.
+    by_package : dict
+        Time spent importing each top-level package (own time of all its
+        modules), in seconds. Modules the interpreter imports at start-up
+        even for an empty script are left out.
+    """
+    startup = _startup_modules()
+    total = 0.
+    by_package = defaultdict(float)
+    for self_s, cumulative_s, name in _import_times('import ' + module_name):
+        if name == module_name:
+            total = cumulative_s
+        if name not in startup:
+            by_package[name.split('.')[0]] += self_s
+    return total, dict(by_package)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--import-profile', action='store_true',
+                        help='import each package and break down the '
+                             'import time')
+    parser.add_argument('--top', type=int, default=5,
+                        help='number of packages listed per import profile')
+    parser.add_argument('--requirements', default='requirements.txt')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for (pkg, version_wanted) in read_requirements(args.requirements):
+        version_installed = installed_version(pkg)
         status = '✓'
-    except ImportError as e:
-        m = None
-        if (pkg != 'numpy' and 'numpy' in str(e)):
-            status = '?'
-            version_installed = 'Needs NumPy'
-        else:
+        if version_installed is None:
             version_installed = 'Not installed'
             status = 'X'
-
-    if m is not None:
-        version_installed = m.__version__
-        if LooseVersion(version_wanted) > LooseVersion(version_installed):
+        elif needs_numpy(pkg):
+            version_installed = 'Needs NumPy'
+            status = '?'
+        elif version_tuple(version_wanted) > version_tuple(version_installed):
             status = 'X'
-    print('[{}] {:<11} {}'.format(
-        status, pkg.ljust(13), version_installed)
-        )
+        failed |= status != '✓'
+        print('[{}] {:<11} {}'.format(
+            status, pkg.ljust(13), version_installed)
+            )
+
+        if args.import_profile and status == '✓':
+            module_name = pkg_names.get(pkg, pkg)
+            try:
+                total, by_package = import_profile(module_name)
+            except ImportError as e:
+                print('    import failed: {}'.format(e))
+                failed = True
+                continue
+            top = sorted(by_package.items(), key=lambda item: -item[1])
+            print('    import {:<10} {:8.1f} ms'.format(module_name,
+                                                        total * 1e3))
+            for name, seconds in top[:args.top]:
+                print('      {:<17} {:8.1f} ms'.format(name, seconds * 1e3))
+    return int(failed)
+
 
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,63 @@
-from ._skdemo import *
+"""Helpers for the scikit-image lectures.
+
+Submodules are imported lazily: `import skdemo` only loads this file, and
+matplotlib, scikit-image, etc. are imported the first time a helper that
+needs them is accessed.
+"""
+import importlib
+import sys
+
+
+# Public name -> submodule defining it
+_lazy_names = {}
+for _module, _names in [
+        ('_skdemo', ['imshow_all', 'imshow_with_histogram', 'mean_filter_demo',
+                     'mean_filter_interactive_demo', 'MeanFilterSteps',
+                     'plot_cdf', 'plot_histogram', 'colorbars', 'add_colorbar',
+                     'match_axes_height', 'scatter_matrix',
+                     'force_integer_ticks', 'discrete_colorbar',
+                     'show_segmentation', 'show_features',
+                     'set_precision', 'get_precision']),
+        ('_histogram', ['channel_histograms', 'clear_histogram_cache']),
+        ('_windows', ['iter_windows', 'window_view']),
+        ('_render', ['render_figure', 'render_batch']),
+        ('_profile', ['profile', 'enable_profiling', 'disable_profiling',
+                      'profile_report', 'reset_profile']),
+        ('_interactive', ['InteractiveRunner', 'interactive']),
+        ('_views', ['ImshowParamsView']),
+        ('_imagestore', ['ImageStore', 'build_image_store']),
+        ('_collection', ['PrefetchCollection']),
+        ('_cache', ['cached']),
+        ('_shared', ['SharedArray', 'ArrayDescriptor', 'attach', 'detach_all',
+                     'call_with_arrays']),
+        ('_tiled', ['tiled_apply', 'footprint_halo', 'sigma_halo']),
+        ('_stream', ['FramePipeline', 'Stage', 'StageStats', 'iter_frames']),
+        ('_workflow', ['Workflow', 'Node']),
+        ('_util', ['iter_channels']),
+        ('_colormaps', ['discrete_cmap']),
+        ]:
+    _lazy_names.update(dict.fromkeys(_names, _module))
+del _module, _names
+
+__all__ = sorted(_lazy_names)
+
+
+def __getattr__(name):
+    try:
+        module = _lazy_names[name]
+    except KeyError:
+        raise AttributeError('module {!r} has no attribute {!r}'
+                             .format(__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_names))
+
+
+# Gray-scale images should actually be gray! `_skdemo` sets this when it is
+# loaded; do it now if matplotlib is already there, since it is free then.
+if 'matplotlib' in sys.modules:
+    sys.modules['matplotlib'].rcParams['image.cmap'] = 'gray'
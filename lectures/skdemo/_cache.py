@@ -0,0 +1,394 @@
+"""Bounded caches and cheap array fingerprints."""
+from __future__ import division
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import threading
+import types
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+
+__all__ = ['cached']
+
+
+def _nbytes(value):
+    """Approximate memory held by `value` (arrays and nested tuples)."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
+class LRUCache(object):
+    """ Least-recently-used mapping bounded in entries and/or bytes.
+
+    Parameters
+    ----------
+    maxsize : int or None
+        Maximum number of entries.
+    maxbytes : int or None
+        Maximum total size of the cached values, as measured by `sizeof`.
+    sizeof : callable
+        Returns the size in bytes of a value. By default, the `nbytes` of
+        arrays (possibly nested in tuples or lists) is counted.
+    """
+
+    def __init__(self, maxsize=128, maxbytes=None, sizeof=_nbytes):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            self.pop(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                # Would evict everything and still not fit.
+                return
+            self._data[key] = (value, size)
+            self.nbytes += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._data.pop(key)
+            except KeyError:
+                return default
+            self.nbytes -= size
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def _evict(self):
+        while self._data and (
+                (self.maxsize is not None and len(self._data) > self.maxsize)
+                or (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+            _, (_, size) = self._data.popitem(last=False)
+            self.nbytes -= size
+
+
+def array_fingerprint(image, n_samples=4096, full=False):
+    """ Hash of the shape, dtype and a strided sample of `image`.
+
+    Only about `n_samples` values spread over the whole array are read, so
+    the fingerprint is cheap even for memory-mapped images, but in-place
+    edits that miss every sampled value go unnoticed. Set `full=True` to
+    hash every byte instead.
+    """
+    image = np.asanyarray(image)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((image.shape, image.dtype.str)).encode())
+    if image.size == 0:
+        return digest.hexdigest()
+    if full or image.ndim == 0:
+        sample = image
+    else:
+        per_axis = max(1, int(np.ceil(n_samples ** (1. / image.ndim))))
+        sample = image[tuple(slice(None, None, max(1, n // per_axis))
+                             for n in image.shape)]
+    digest.update(np.ascontiguousarray(sample).reshape(-1).view(np.uint8))
+    return digest.hexdigest()
+
+
+def array_key(image):
+    """Cache key combining the identity and fingerprint of `image`."""
+    return (id(image), image.shape, image.dtype.str, array_fingerprint(image))
+
+
+_MISSING = object()
+
+
+def _default_directory():
+    return os.environ.get('SKDEMO_CACHE_DIR', os.path.join(
+        os.path.expanduser('~'), '.cache', 'skdemo'))
+
+
+def _hash_value(digest, value, n_samples, full):
+    """Feed an argument value into `digest`; arrays by fingerprint."""
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        digest.update(b'ndarray:')
+        digest.update(array_fingerprint(value, n_samples, full).encode())
+    elif isinstance(value, (tuple, list)):
+        digest.update('{}:{}('.format(type(value).__name__,
+                                      len(value)).encode())
+        for item in value:
+            _hash_value(digest, item, n_samples, full)
+        digest.update(b')')
+    elif isinstance(value, dict):
+        digest.update('dict:{}('.format(len(value)).encode())
+        for key in sorted(value, key=repr):
+            _hash_value(digest, key, n_samples, full)
+            _hash_value(digest, value[key], n_samples, full)
+        digest.update(b')')
+    elif value is None or isinstance(value, (bool, int, float, complex, str,
+                                             bytes, np.generic)):
+        digest.update(repr((type(value).__name__, value)).encode())
+    else:
+        try:
+            digest.update(pickle.dumps(value, protocol=4))
+        except Exception:
+            raise TypeError('Cannot build a cache key from an argument of '
+                            'type {}'.format(type(value).__name__))
+
+
+def _function_token(func, _seen=None):
+    """ Directory name of `func`, changing when its source changes.
+
+    The values the function closes over and its default arguments are part
+    of the token, so two closures made by the same factory with different
+    values get different tokens. Raises TypeError if one of these values
+    cannot be hashed.
+    """
+    try:
+        source = inspect.getsource(func).encode()
+    except (IOError, OSError, TypeError):
+        code = func.__code__
+        source = code.co_code + repr(code.co_consts).encode()
+    digest = hashlib.blake2b(source, digest_size=8)
+    seen = set() if _seen is None else _seen
+    seen.add(id(func))
+    cells = []
+    for cell in getattr(func, '__closure__', None) or ():
+        try:
+            cells.append(cell.cell_contents)
+        except ValueError:
+            # Variable not assigned yet when the function was created
+            cells.append('<empty cell>')
+    for value in cells + [getattr(func, '__defaults__', None),
+                          getattr(func, '__kwdefaults__', None)]:
+        if isinstance(value, types.FunctionType):
+            # Nested helpers by token; a recursive closure refers to itself
+            digest.update(b'func:')
+            if id(value) not in seen:
+                digest.update(_function_token(value, seen).encode())
+        else:
+            _hash_value(digest, value, None, True)
+    name = '{}.{}'.format(func.__module__,
+                          getattr(func, '__qualname__', func.__name__))
+    return '{}-{}'.format(name, digest.hexdigest())
+
+
+def _is_array(value):
+    return isinstance(value, np.ndarray) and value.dtype != object
+
+
+class _DiskStore(object):
+    """ Results stored as one directory per key, evicted least recently used.
+
+    Arrays, and tuples or lists of arrays, are saved as ``.npy`` files and
+    loaded memory-mapped; other results are pickled. Each entry directory
+    is renamed into place once complete, and its modification time is
+    bumped on every hit.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+
+    def load(self, key):
+        entry = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(entry, 'meta.json')) as f:
+                meta = json.load(f)
+            if meta['kind'] == 'pickle':
+                with open(os.path.join(entry, 'result.pkl'), 'rb') as f:
+                    result = pickle.load(f)
+            else:
+                arrays = [self._load_array(os.path.join(entry,
+                                                        '{}.npy'.format(i)))
+                          for i in range(meta['count'])]
+                result = (arrays[0] if meta['kind'] == 'array' else
+                          tuple(arrays) if meta['kind'] == 'tuple' else
+                          arrays)
+            os.utime(entry)
+        except (IOError, OSError, ValueError, EOFError):
+            self.misses += 1
+            return _MISSING
+        self.hits += 1
+        return result
+
+    @staticmethod
+    def _load_array(path):
+        try:
+            return np.load(path, mmap_mode='r')
+        except ValueError:
+            # Empty arrays cannot be memory-mapped
+            return np.load(path)
+
+    def save(self, key, result):
+        """Store `result`; return it as it will be loaded from the store."""
+        entry = os.path.join(self.directory, key)
+        tmp = '{}.tmp-{}'.format(entry, uuid.uuid4().hex)
+        os.makedirs(tmp)
+        try:
+            if _is_array(result):
+                kind, arrays = 'array', [result]
+            elif isinstance(result, (tuple, list)) and result and \
+                    all(_is_array(a) for a in result):
+                kind, arrays = type(result).__name__, list(result)
+            else:
+                kind, arrays = 'pickle', []
+                with open(os.path.join(tmp, 'result.pkl'), 'wb') as f:
+                    pickle.dump(result, f, protocol=4)
+            for i, array in enumerate(arrays):
+                np.save(os.path.join(tmp, '{}.npy'.format(i)), array)
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump({'kind': kind, 'count': len(arrays)}, f)
+            os.rename(tmp, entry)
+        except OSError:
+            # Stored concurrently by another process, or not writable
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+        stored = self.load(key)
+        if stored is _MISSING:
+            # Larger than the whole budget
+            self.misses -= 1
+            return result
+        self.hits -= 1
+        return stored
+
+    def _entries(self):
+        """(mtime, size, path) of all complete entries."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for group in os.listdir(self.directory):
+            group = os.path.join(self.directory, group)
+            if not os.path.isdir(group):
+                continue
+            for name in os.listdir(group):
+                if '.tmp-' in name:
+                    continue
+                path = os.path.join(group, name)
+                try:
+                    size = sum(os.path.getsize(os.path.join(path, f))
+                               for f in os.listdir(path))
+                    entries.append((os.path.getmtime(path), size, path))
+                except OSError:
+                    continue
+        return entries
+
+    @property
+    def nbytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove the least recently used entries beyond `max_bytes`."""
+        if self.max_bytes is None:
+            return
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self, group=None):
+        path = self.directory if group is None else os.path.join(
+            self.directory, group)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def cached(func=None, directory=None, max_bytes=2**30, full_hash=False,
+           n_samples=4096, ignore=()):
+    """ Cache the results of an image function on disk.
+
+    Use as ``@cached`` or ``@cached(max_bytes=..., ...)``. A call is looked
+    up by the source of the function, the values it closes over, and its
+    bound arguments (defaults included, so positional and keyword calls
+    share entries). Decorating a closure over values that cannot be hashed
+    raises TypeError. Arrays in the
+    arguments are keyed by `array_fingerprint`: their shape, dtype and a
+    strided sample of about `n_samples` values, or every byte with
+    `full_hash=True`. In-place edits of an input that miss the sampled
+    values are not noticed unless `full_hash` is set.
+
+    Array results (or tuples and lists of arrays) are stored as ``.npy``
+    files and returned memory-mapped read-only, including on the call that
+    computes them; other results are pickled. The whole cache directory is
+    kept under `max_bytes` by removing the least recently used results.
+
+    Parameters
+    ----------
+    directory : str
+        Cache directory, shared by all cached functions. By default
+        $SKDEMO_CACHE_DIR, or ~/.cache/skdemo.
+    max_bytes : int or None
+        Size budget of the cache directory.
+    ignore : sequence of str
+        Arguments not part of the key (e.g. verbosity flags).
+
+    Examples
+    --------
+    >>> @cached                                             # doctest: +SKIP
+    ... def cached_slic(image, n_segments=100):
+    ...     return segmentation.slic(image, n_segments=n_segments)
+
+    The wrapped function has a `cache` attribute holding the store (with
+    `hits`, `misses` and `nbytes`) and a `clear_cache()` method.
+    """
+    if func is None:
+        return functools.partial(cached, directory=directory,
+                                 max_bytes=max_bytes, full_hash=full_hash,
+                                 n_samples=n_samples, ignore=ignore)
+    store = _DiskStore(directory or _default_directory(), max_bytes)
+    group = _function_token(func)
+    signature = inspect.signature(func)
+    ignore = frozenset(ignore)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        digest = hashlib.blake2b(digest_size=20)
+        for name, value in bound.arguments.items():
+            if name in ignore:
+                continue
+            digest.update(name.encode() + b'=')
+            _hash_value(digest, value, n_samples, full_hash)
+        key = os.path.join(group, digest.hexdigest())
+
+        result = store.load(key)
+        if result is _MISSING:
+            result = store.save(key, func(*args, **kwargs))
+        return result
+
+    wrapper.cache = store
+    wrapper.clear_cache = functools.partial(store.clear, group)
+    return wrapper
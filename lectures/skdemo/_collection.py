@@ -0,0 +1,299 @@
+"""Image collection decoding ahead on threads, cropped and reduced on load."""
+from __future__ import division
+
+import glob
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ._cache import LRUCache
+
+
+__all__ = ['PrefetchCollection']
+
+
+def _expand(load_pattern):
+    """File names matching a pattern (or patterns) as `ImageCollection`."""
+    if isinstance(load_pattern, str):
+        load_pattern = load_pattern.split(os.pathsep)
+    files = []
+    for pattern in load_pattern:
+        files.extend(sorted(glob.glob(os.path.expanduser(pattern))))
+    return files
+
+
+def _crop_box(crop, width, height):
+    """(left, upper, right, lower) box of a (rows, cols) pair of slices."""
+    if crop is None:
+        return 0, 0, width, height
+    rows, cols = crop
+    top, bottom, row_step = rows.indices(height)
+    left, right, col_step = cols.indices(width)
+    if row_step != 1 or col_step != 1:
+        raise ValueError('Crops must be contiguous, got {}'.format(crop))
+    return left, top, max(left, right), max(top, bottom)
+
+
+def _decoded_scale(width, height, size):
+    """ Full-resolution pixels per decoded pixel, along (x, y).
+
+    JPEG draft decoding divides the size by 1, 2, 4 or 8, rounding up, so
+    the last decoded row or column may stand for fewer pixels: the scale is
+    the draft factor, not the ratio of the sizes.
+    """
+    for scale in (1, 2, 4, 8):
+        if (-(-width // scale), -(-height // scale)) == tuple(size):
+            return scale, scale
+    return width / size[0], height / size[1]
+
+
+def _read_pil(path, crop, reduce, mode):
+    from PIL import Image
+
+    with Image.open(path) as img:
+        width, height = img.size
+        left, top, right, bottom = _crop_box(crop, width, height)
+        if reduce > 1 and img.format == 'JPEG':
+            # Decode at 1/2, 1/4 or 1/8 scale in the DCT domain: the
+            # largest reduction not larger than `reduce` whose pixels do not
+            # straddle the crop edges, so that they can be averaged
+            # exactly. Decoded pixels only cover the crop partially
+            # otherwise, and resampling them blurs the result.
+            draft = max(d for d in (1, 2, 4, 8) if d <= reduce and
+                        left % d == 0 and top % d == 0 and
+                        (right % d == 0 or right == width) and
+                        (bottom % d == 0 or bottom == height))
+            if draft > 1:
+                img.draft(mode, (-(-width // draft), -(-height // draft)))
+        scale_x, scale_y = _decoded_scale(width, height, img.size)
+        if mode is not None and img.mode != mode:
+            img = img.convert(mode)
+        elif img.mode == 'P':
+            # Palette indices cannot be averaged; decode the colors
+            img = img.convert('RGBA' if 'transparency' in img.info
+                              else 'RGB')
+        elif img.mode == '1' and reduce > 1:
+            img = img.convert('L')
+        dtype = None
+        if img.mode.startswith('I;16') and reduce > 1:
+            # 16-bit images are only resampled as 32-bit integers
+            dtype = np.uint16
+            img = img.convert('I')
+
+        # Crop box in decoded pixels, clamped to the decoded image
+        size_x, size_y = img.size
+        box = (min(left / scale_x, size_x), min(top / scale_y, size_y),
+               min(right / scale_x, size_x), min(bottom / scale_y, size_y))
+        size = (int(np.ceil((right - left) / reduce)),
+                int(np.ceil((bottom - top) / reduce)))
+        factor_x, factor_y = reduce / scale_x, reduce / scale_y
+        # The far edges of the image may end within a decoded pixel (or a
+        # block of `reduce`): round outward there, as partial blocks are
+        # averaged over the pixels they have
+        outer = (box[0], box[1],
+                 size_x if right == width else box[2],
+                 size_y if bottom == height else box[3])
+        if not (size[0] and size[1]):
+            img = img.crop((0, 0) + size)
+        elif factor_x == int(factor_x) and factor_y == int(factor_y) and \
+                all(b == int(b) for b in outer):
+            outer = tuple(int(b) for b in outer)
+            if factor_x > 1 or factor_y > 1:
+                img = img.reduce((int(factor_x), int(factor_y)), box=outer)
+            else:
+                img = img.crop(outer)
+        else:
+            img = img.resize(size, Image.BOX, box=box)
+        image = np.asarray(img)
+        return image if dtype is None else image.astype(dtype)
+
+
+def _box_weights(n, n_out):
+    """ (n_out, n) matrix averaging `n` pixels into `n_out` equal boxes.
+
+    Box `i` covers ``[i * n / n_out, (i + 1) * n / n_out)``, as for PIL's
+    BOX filter; pixels straddling two boxes are split between them.
+    """
+    edges = np.arange(n_out + 1) * (n / n_out)
+    pixels = np.arange(n)
+    overlap = (np.minimum(edges[1:, None], pixels + 1) -
+               np.maximum(edges[:-1, None], pixels))
+    weights = np.clip(overlap, 0, None).astype(np.float32)
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+def _box_resample(image, reduce):
+    """`image` reduced by a non-integer factor, like `_read_pil` does."""
+    height, width = image.shape[:2]
+    rows = _box_weights(height, int(np.ceil(height / reduce)))
+    cols = _box_weights(width, int(np.ceil(width / reduce)))
+    image = np.tensordot(rows, image.astype(np.float32), axes=(1, 0))
+    return np.moveaxis(np.tensordot(cols, image, axes=(1, 1)), 0, 1)
+
+
+def _read_array(path, crop, reduce, load_func):
+    from ._preview import area_downsample
+
+    image = np.asarray(load_func(path))
+    if crop is not None:
+        image = image[tuple(crop)]
+    if reduce > 1:
+        dtype = image.dtype
+        if reduce == int(reduce):
+            image = area_downsample(image, int(reduce))
+        else:
+            image = _box_resample(image, reduce)
+        if dtype.kind in 'ui':
+            image = np.rint(image).astype(dtype)
+    return image
+
+
+class PrefetchCollection(object):
+    """ Collection of images decoded ahead of use on a thread pool.
+
+    Like `skimage.io.ImageCollection`, images are loaded on demand, but the
+    next `prefetch` images are decoded in the background while the current
+    one is processed, and decoded images are kept in a cache bounded in
+    bytes.
+
+    Crops and reductions are applied while loading: JPEG files are decoded
+    at a reduced scale directly (PIL draft mode), so their full-resolution
+    pixels are never materialized. Other formats are decoded in full, then
+    cropped and reduced by PIL before they are turned into arrays, so only
+    the reduced image is kept. Reductions average over `reduce` x `reduce`
+    blocks (JPEG draft decoding approximates this).
+
+    Parameters
+    ----------
+    load_pattern : str or list of str
+        Glob pattern(s) of the files, as for `ImageCollection`. Several
+        patterns in a string are separated by `os.pathsep`.
+    crop : tuple of slice
+        (rows, cols) slices of the full-resolution image to keep, e.g.
+        ``np.s_[:, 500:2487]``.
+    reduce : int or float
+        Reduction factor; images are `reduce` times smaller along each axis
+        (rounded up), whichever reader decodes them. Non-integer factors
+        average over boxes of fractional size.
+    mode : str
+        PIL mode to decode to, e.g. 'L' for gray-scale or 'RGB'.
+    prefetch : int
+        Number of images decoded ahead of the one requested; 0 decodes on
+        the caller's thread only.
+    workers : int
+        Number of decoding threads, by default `prefetch` (at most the
+        number of CPUs).
+    cache_bytes : int or None
+        Size bound of the cache of decoded images.
+    load_func : callable
+        Reader for files PIL cannot open, by default `skimage.io.imread`;
+        `mode` does not apply to them.
+
+    Examples
+    --------
+    >>> ic = PrefetchCollection('../images/pano/DFM_*',     # doctest: +SKIP
+    ...                         crop=np.s_[:, 500:2487], reduce=4, mode='L')
+    >>> for frame in ic:                                    # doctest: +SKIP
+    ...     process(frame)
+    """
+
+    def __init__(self, load_pattern, crop=None, reduce=1, mode=None,
+                 prefetch=4, workers=None, cache_bytes=256 * 2**20,
+                 load_func=None):
+        if reduce < 1:
+            raise ValueError('reduce must be at least 1, got {}'
+                             .format(reduce))
+        self.files = _expand(load_pattern)
+        self.crop = crop
+        self.reduce = reduce
+        self.mode = mode
+        self.prefetch = prefetch
+        self.load_func = load_func
+        self.cache = LRUCache(maxsize=None, maxbytes=cache_bytes)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        if prefetch > 0:
+            workers = workers or min(prefetch, os.cpu_count() or 1)
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return [self[i] for i in range(*n.indices(len(self)))]
+        num = len(self)
+        if not -num <= n < num:
+            raise IndexError('Image index {} out of range'.format(n))
+        n %= num
+
+        image = self.cache.get(n)
+        if image is None:
+            with self._lock:
+                future = self._pending.pop(n, None)
+            image = future.result() if future is not None else self._load(n)
+            self.cache[n] = image
+        self._schedule(n + 1)
+        return image
+
+    def _load(self, n):
+        path = self.files[n]
+        image = None
+        if self.load_func is None:
+            try:
+                image = _read_pil(path, self.crop, self.reduce, self.mode)
+            except (IOError, OSError):
+                # Formats PIL does not read (or only with missing codecs)
+                from skimage.io import imread
+                image = _read_array(path, self.crop, self.reduce, imread)
+        else:
+            image = _read_array(path, self.crop, self.reduce, self.load_func)
+        # Decoded images are shared through the cache
+        image.setflags(write=False)
+        return image
+
+    def _schedule(self, start):
+        """Keep the images [start, start + prefetch) decoding or cached."""
+        if self._executor is None:
+            return
+        window = range(start, min(start + self.prefetch, len(self)))
+        with self._lock:
+            for i, future in list(self._pending.items()):
+                if i in window:
+                    continue
+                # Out of the window after a jump: drop what has not started,
+                # keep what has been decoded
+                if future.done():
+                    del self._pending[i]
+                    if not future.cancelled() and \
+                            future.exception() is None:
+                        self.cache[i] = future.result()
+                elif future.cancel():
+                    del self._pending[i]
+            for i in window:
+                if i not in self._pending and i not in self.cache:
+                    self._pending[i] = self._executor.submit(self._load, i)
+
+    def close(self):
+        """Cancel pending decodes and stop the worker threads."""
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
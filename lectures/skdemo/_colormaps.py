@@ -0,0 +1,28 @@
+"""Discrete colormaps (matplotlib.colors only, no pyplot)."""
+import numpy as np
+
+from matplotlib import cm
+from matplotlib.colors import Normalize, ListedColormap, colorConverter
+
+
+__all__ = ['discrete_cmap']
+
+
+def discrete_cmap(N=8, colors=None, cmap='viridis', norm=None, 
+                  use_bounds=False, zero=None):
+    if (colors is None):
+        if (norm is None):
+            if (use_bounds):
+                norm=Normalize(vmin=0, vmax=N-1)
+            else:
+                norm=Normalize(vmin=-0.5, vmax=N-0.5)
+        sm=cm.ScalarMappable(cmap=cmap,norm=norm)
+        cols=sm.to_rgba(range(N))[:,:3]
+    else:
+        cols=colors
+        N=len(colors) # Number of rows
+    
+    if (zero is not None):
+        zcol=colorConverter.to_rgb(zero)
+        cols=np.insert(cols,0,zcol, axis=0)
+    return ListedColormap(cols)
@@ -0,0 +1,132 @@
+"""Single-pass histograms of multi-channel images."""
+from __future__ import division
+
+import numpy as np
+
+from skimage.util.dtype import dtype_limits
+
+from ._cache import LRUCache, array_key
+from ._preview import streamed_minmax
+
+
+__all__ = ['channel_histograms', 'clear_histogram_cache']
+
+
+# Integer images whose full value range fits a reasonably small bincount.
+_MAX_INTEGER_LEVELS = 2**16
+
+# Histograms of recently plotted images, shared by `plot_histogram`,
+# `imshow_with_histogram` and `plot_cdf`.
+_HISTOGRAM_CACHE = LRUCache(maxsize=32)
+
+
+def channel_histograms(image, nbins=256, source_range='image',
+                       chunk_pixels=2**20, cache=False):
+    """ Histogram all channels of `image` in a single pass over the pixels.
+
+    Integer images get one bin per intensity value (like
+    `skimage.exposure.histogram`) and are counted with a single `np.bincount`
+    over channel-offset values. Float images are binned into `nbins` bins.
+    All channels share the same bins. The image is read in row strips of
+    about `chunk_pixels` pixels, so memory-mapped arrays never load fully.
+
+    Parameters
+    ----------
+    image : ndarray
+        2D gray-scale image or 3D image with channels on the last axis.
+    nbins : int
+        Number of bins for float images; ignored for integer images.
+    source_range : {'image', 'dtype'}
+        Take the bin range from the image values or from its dtype.
+    chunk_pixels : int
+        Approximate number of pixels processed at once.
+    cache : bool
+        Look up and store the result in a small LRU cache keyed by the
+        identity, shape, dtype and a sampled fingerprint of `image`. Cached
+        results are read-only.
+
+    Returns
+    -------
+    hist : ndarray, shape (n_channels, n_bins)
+        Pixel counts for each channel.
+    bin_centers : ndarray, shape (n_bins,)
+        Intensity at the center of each bin.
+    """
+    image = np.asanyarray(image)
+    if cache:
+        key = (array_key(image), nbins, source_range)
+        result = _HISTOGRAM_CACHE.get(key)
+        if result is None:
+            result = channel_histograms(image, nbins, source_range,
+                                        chunk_pixels)
+            for arr in result:
+                arr.setflags(write=False)
+            _HISTOGRAM_CACHE[key] = result
+        return result
+
+    if image.dtype == bool:
+        image = image.view(np.uint8)
+    n_channels = image.shape[2] if image.ndim == 3 else 1
+    row_pixels = max(1, int(np.prod(image.shape[1:2])))
+    chunk_rows = max(1, chunk_pixels // row_pixels)
+
+    integer = np.issubdtype(image.dtype, np.integer)
+    if integer and image.dtype.itemsize <= 2 and source_range == 'image' \
+            and not np.issubdtype(image.dtype, np.signedinteger):
+        # uint8/uint16 fast path: count the whole dtype range without a
+        # separate min/max pass, then trim to the occupied bins.
+        lo, hi = 0, np.iinfo(image.dtype).max
+    elif source_range == 'dtype':
+        lo, hi = dtype_limits(image, clip_negative=False)
+    elif source_range == 'image':
+        lo, hi = streamed_minmax(image, chunk_rows)
+    else:
+        raise ValueError("Wrong value for the `source_range` argument")
+
+    if integer and hi - lo < _MAX_INTEGER_LEVELS:
+        lo, hi = int(lo), int(hi)
+        hist = _integer_counts(image, lo, hi - lo + 1, n_channels, chunk_rows)
+        bin_centers = np.arange(lo, hi + 1)
+        if source_range == 'image':
+            occupied = np.flatnonzero(hist.any(axis=0))
+            if occupied.size:
+                span = slice(occupied[0], occupied[-1] + 1)
+                hist, bin_centers = hist[:, span], bin_centers[span]
+    else:
+        hist = _binned_counts(image, lo, hi, nbins, n_channels, chunk_rows)
+        width = (hi - lo) / nbins
+        bin_centers = lo + width * (np.arange(nbins) + 0.5)
+    return hist, bin_centers
+
+
+def clear_histogram_cache():
+    """Drop all histograms cached by `channel_histograms(..., cache=True)`."""
+    _HISTOGRAM_CACHE.clear()
+
+
+def _iter_chunks(image, n_channels, chunk_rows):
+    """Yield row strips of `image` as (n_pixels, n_channels) arrays."""
+    for r0 in range(0, image.shape[0], chunk_rows):
+        yield np.asarray(image[r0:r0 + chunk_rows]).reshape(-1, n_channels)
+
+
+def _integer_counts(image, lo, levels, n_channels, chunk_rows):
+    offsets = np.arange(n_channels, dtype=np.intp) * levels - lo
+    counts = np.zeros(n_channels * levels, dtype=np.int64)
+    for chunk in _iter_chunks(image, n_channels, chunk_rows):
+        idx = chunk.astype(np.intp)
+        idx += offsets
+        counts += np.bincount(idx.ravel(), minlength=counts.size)
+    return counts.reshape(n_channels, levels)
+
+
+def _binned_counts(image, lo, hi, nbins, n_channels, chunk_rows):
+    scale = nbins / (hi - lo) if hi > lo else 0.
+    offsets = np.arange(n_channels, dtype=np.intp) * nbins
+    counts = np.zeros(n_channels * nbins, dtype=np.int64)
+    for chunk in _iter_chunks(image, n_channels, chunk_rows):
+        idx = ((chunk - lo) * scale).astype(np.intp)
+        np.clip(idx, 0, nbins - 1, out=idx)
+        idx += offsets
+        counts += np.bincount(idx.ravel(), minlength=counts.size)
+    return counts.reshape(n_channels, nbins)
@@ -0,0 +1,247 @@
+"""Decoded images packed into one memory-mapped file.
+
+Decoding the JPEG/PNG/TIFF files of `images/` takes a noticeable part of
+the start-up of every lecture and batch job. `build_image_store` decodes a
+directory once into a store made of a binary blob, holding the pixels of
+every image one after the other, and a JSON index of their name, shape,
+dtype and offset. `ImageStore` then returns the images as read-only
+`np.memmap` views of the blob: nothing is decoded or copied, and the pages
+are shared between all processes reading the same store::
+
+    store = build_image_store('../images')    # once, or when images change
+    beach = ImageStore('../images')['Bells-Beach.jpg']
+"""
+from __future__ import division
+
+import fnmatch
+import io
+import json
+import os
+import uuid
+import warnings
+
+import numpy as np
+
+
+__all__ = ['ImageStore', 'build_image_store']
+
+
+STORE_DIRNAME = '.imagestore'
+INDEX_FILENAME = 'index.json'
+PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.tif', '*.tiff', '*.gif', '*.bmp')
+
+# Offsets of the images in the blob are aligned to cache lines
+_ALIGNMENT = 64
+
+
+def _store_dir(source, store):
+    return store if store is not None else os.path.join(source,
+                                                        STORE_DIRNAME)
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _find_images(source, patterns):
+    names = []
+    for dirpath, dirnames, filenames in os.walk(source):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for filename in sorted(filenames):
+            if any(fnmatch.fnmatch(filename.lower(), p) for p in patterns):
+                path = os.path.join(dirpath, filename)
+                names.append(os.path.relpath(path, source).replace(os.sep,
+                                                                   '/'))
+    return names
+
+
+def _read_index(directory):
+    with io.open(os.path.join(directory, INDEX_FILENAME),
+                 encoding='utf-8') as f:
+        return json.load(f)
+
+
+class ImageStore(object):
+    """ Read-only access to a store written by `build_image_store`.
+
+    Parameters
+    ----------
+    source : str
+        Directory of the original images.
+    store : str
+        Directory of the store, by default ``<source>/.imagestore``.
+    stale : {'reload', 'raise', 'ignore'}
+        What to do when an image file changed after the store was built:
+        decode the file again (with a warning), raise a `ValueError` or
+        return the stored image anyway. Images are checked against the
+        modification time and size of their file on every access.
+
+    Examples
+    --------
+    >>> store = ImageStore('../images')                     # doctest: +SKIP
+    >>> store['pano/JDW_0302.jpg'].shape                    # doctest: +SKIP
+    (720, 477, 3)
+    """
+
+    def __init__(self, source, store=None, stale='reload'):
+        if stale not in ('reload', 'raise', 'ignore'):
+            raise ValueError('Unknown stale policy: {!r}'.format(stale))
+        self.source = source
+        self.directory = _store_dir(source, store)
+        self.stale_policy = stale
+        index = _read_index(self.directory)
+        self._entries = index['images']
+        blob = os.path.join(self.directory, index['blob'])
+        if os.path.getsize(blob):
+            self._blob = np.memmap(blob, dtype=np.uint8, mode='r')
+        else:
+            self._blob = np.zeros(0, dtype=np.uint8)
+
+    @property
+    def names(self):
+        return sorted(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __getitem__(self, name):
+        return self._get(name, None, stacklevel=3)
+
+    def is_stale(self, name):
+        """Whether the file of `name` changed after the store was built."""
+        entry = self._entries[name]
+        path = os.path.join(self.source, name)
+        if not os.path.exists(path):
+            return False
+        return list(_source_stat(path)) != [entry['mtime_ns'], entry['size']]
+
+    def stale(self):
+        """Names of the images whose file changed since the store was built."""
+        return [name for name in self.names if self.is_stale(name)]
+
+    def get(self, name, stale=None):
+        """ Image `name`, as a read-only memory-mapped view.
+
+        `stale` overrides the policy given to the constructor. A stale
+        image that is decoded again is returned as a regular array.
+        """
+        return self._get(name, stale, stacklevel=3)
+
+    def _get(self, name, stale, stacklevel):
+        try:
+            entry = self._entries[name]
+        except KeyError:
+            raise KeyError('{!r} is not in the image store {}'
+                           .format(name, self.directory))
+        stale = stale or self.stale_policy
+        if stale != 'ignore' and self.is_stale(name):
+            message = ('{} changed after the image store was built; run '
+                       'build_image_store to update it'.format(name))
+            if stale == 'raise':
+                raise ValueError(message)
+            warnings.warn(message, stacklevel=stacklevel)
+            from skimage import io as skio
+            return skio.imread(os.path.join(self.source, name))
+
+        dtype = np.dtype(entry['dtype'])
+        start = entry['offset']
+        stop = start + entry['nbytes']
+        return self._blob[start:stop].view(dtype).reshape(entry['shape'])
+
+
+def build_image_store(source, store=None, patterns=PATTERNS, imread=None,
+                      verbose=False):
+    """ Decode the images of `source` (recursively) into a packed store.
+
+    Images whose file did not change since the previous build are copied
+    from the previous store instead of being decoded again. The new blob
+    gets a new file name and the index is replaced last, so readers of the
+    previous store keep valid mappings while the store is rebuilt.
+
+    Parameters
+    ----------
+    source : str
+        Directory of the images. Image names are their paths relative to
+        it, with '/' separators, e.g. 'pano/JDW_0302.jpg'.
+    store : str
+        Directory of the store, by default ``<source>/.imagestore``.
+    patterns : sequence of str
+        File name patterns of the images to include.
+    imread : callable
+        Image reader, by default `skimage.io.imread`.
+
+    Returns
+    -------
+    store : `ImageStore`
+    """
+    directory = _store_dir(source, store)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    if imread is None:
+        from skimage.io import imread
+
+    try:
+        previous = ImageStore(source, store, stale='ignore')
+    except (IOError, OSError, ValueError, KeyError):
+        previous = None
+
+    blob_name = 'images-{}.bin'.format(uuid.uuid4().hex[:12])
+    entries = {}
+    offset = 0
+    with open(os.path.join(directory, blob_name), 'wb') as blob:
+        for name in _find_images(source, patterns):
+            path = os.path.join(source, name)
+            mtime_ns, size = _source_stat(path)
+            if previous is not None and name in previous and \
+                    not previous.is_stale(name):
+                image = previous.get(name, stale='ignore')
+                action = 'copied'
+            else:
+                try:
+                    image = np.asarray(imread(path))
+                except Exception as err:
+                    warnings.warn('Skipping {}: {}'.format(name, err))
+                    continue
+                if image.dtype == object:
+                    warnings.warn('Skipping {}: not a single image'
+                                  .format(name))
+                    continue
+                action = 'decoded'
+            image = np.ascontiguousarray(image)
+            padding = -offset % _ALIGNMENT
+            blob.write(b'\0' * padding)
+            offset += padding
+            blob.write(image.data)
+            entries[name] = {'shape': list(image.shape),
+                             'dtype': image.dtype.str,
+                             'offset': offset,
+                             'nbytes': image.nbytes,
+                             'mtime_ns': mtime_ns,
+                             'size': size}
+            offset += image.nbytes
+            if verbose:
+                print('{:<8} {} {} {}'.format(action, name, image.shape,
+                                              image.dtype))
+
+    index_path = os.path.join(directory, INDEX_FILENAME)
+    with io.open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'blob': blob_name, 'images': entries},
+                           indent=1, sort_keys=True))
+    os.replace(index_path + '.tmp', index_path)
+
+    # Old blobs stay readable through existing mappings after removal
+    del previous
+    for filename in os.listdir(directory):
+        if filename.startswith('images-') and filename != blob_name:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+    return ImageStore(source, store)
@@ -0,0 +1,251 @@
+"""Debounced, memoizing background runner for interactive widgets."""
+from __future__ import division
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ._cache import LRUCache, array_key
+
+
+__all__ = ['InteractiveRunner', 'interactive']
+
+
+_MISSING = object()
+
+
+def _params_key(params):
+    """Hashable key of a parameter dict; arrays are keyed by fingerprint."""
+    return tuple(sorted(
+        (name, array_key(value) if isinstance(value, np.ndarray) else value)
+        for name, value in params.items()))
+
+
+class InteractiveRunner(object):
+    """ Evaluate `compute(**params)` off the caller's thread.
+
+    Requests are debounced: a request only starts after `debounce` seconds
+    without a newer one. Computations run one at a time on a worker thread;
+    a queued computation is cancelled as soon as a newer request arrives,
+    and the result of a running one that has been superseded is cached but
+    not delivered. Results are memoized per parameter tuple in a bounded
+    LRU cache, so returning to previous settings is immediate.
+
+    Parameters
+    ----------
+    compute : callable
+        Function of keyword-arguments only.
+    on_result : callable
+        Called as ``on_result(result, **params)`` with the result of the
+        latest request, from the worker (or timer) thread.
+    debounce : float
+        Quiet period in seconds before a request is started.
+    cache_size, cache_bytes : int or None
+        Bounds of the result cache, in entries and bytes.
+    """
+
+    def __init__(self, compute, on_result, debounce=0.15, cache_size=32,
+                 cache_bytes=None):
+        self.compute = compute
+        self.on_result = on_result
+        self.debounce = debounce
+        self.cache = LRUCache(maxsize=cache_size, maxbytes=cache_bytes)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._timer = None
+        self._future = None
+
+    def evaluate(self, **params):
+        """Compute (or fetch from the cache) synchronously."""
+        key = _params_key(params)
+        result = self.cache.get(key, _MISSING)
+        if result is _MISSING:
+            result = self.compute(**params)
+            self.cache[key] = result
+        return result
+
+    def submit(self, **params):
+        """Request an update for `params`, superseding earlier requests."""
+        with self._lock:
+            self._generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
+            if self._future is not None:
+                self._future.cancel()
+            self._timer = threading.Timer(self.debounce, self._dispatch,
+                                          (self._generation, params))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def wait(self):
+        """Block until the latest request has been handled."""
+        timer = self._timer
+        if timer is not None:
+            timer.join()
+        future = self._future
+        if future is not None and not future.cancelled():
+            future.result()
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _dispatch(self, generation, params):
+        key = _params_key(params)
+        result = self.cache.get(key, _MISSING)
+        if result is not _MISSING:
+            self._deliver(generation, params, result)
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._future = self._executor.submit(self._run, generation, key,
+                                                 params)
+
+    def _run(self, generation, key, params):
+        if generation != self._generation:
+            return
+        result = self.compute(**params)
+        self.cache[key] = result
+        self._deliver(generation, params, result)
+
+    def _deliver(self, generation, params, result):
+        if generation == self._generation:
+            self.on_result(result, **params)
+
+
+def _poster(fig):
+    """ Function scheduling callbacks on the thread running the event loop.
+
+    Must be called from that thread. In a Jupyter kernel, callbacks go
+    through the kernel's asyncio loop; otherwise a GUI timer of the canvas
+    of `fig` runs the latest callback posted since its last tick.
+
+    Returns
+    -------
+    post : callable
+        ``post(callback)``, callable from any thread.
+    timer : `TimerBase` or None
+        Timer to keep alive while callbacks are posted.
+    """
+    try:
+        return asyncio.get_running_loop().call_soon_threadsafe, None
+    except RuntimeError:
+        pass
+    pending = []
+    lock = threading.Lock()
+
+    def drain():
+        with lock:
+            callbacks = pending[:]
+            del pending[:]
+        if callbacks:
+            callbacks[-1]()
+
+    def post(callback):
+        with lock:
+            pending.append(callback)
+
+    timer = fig.canvas.new_timer(interval=50)
+    timer.add_callback(drain)
+    timer.start()
+    return post, timer
+
+
+def interactive(compute, fig=None, debounce=0.15, cache_size=32,
+                cache_bytes=None, autoscale=True, imshow_kwargs=None,
+                **widget_kwargs):
+    """ Interactive image display driven by an `InteractiveRunner`.
+
+    Like `ipywidgets.interact`, widgets are built from `widget_kwargs`
+    (slider tuples, option lists, `fixed` values, widgets, ...). `compute`
+    takes these parameters and returns an image, or a tuple of images that
+    are shown side by side. On a widget change, the existing image artists
+    are updated with `set_data` instead of rebuilding the figure. Images
+    are computed on a worker thread, but artists and outputs are only
+    updated on the thread running the event loop.
+
+    Parameters
+    ----------
+    fig : `Figure`
+        Figure to draw into; by default a new pyplot figure.
+    autoscale : bool
+        Rescale the intensity limits to each new image.
+    imshow_kwargs : dict
+        Keyword-arguments passed to `imshow` for the initial images.
+
+    Returns
+    -------
+    runner : `InteractiveRunner`
+        Its `widgets` attribute holds the displayed widget box.
+    """
+    import matplotlib
+    import ipywidgets
+    from IPython.display import display
+    from ._skdemo import _subplots
+
+    controls = ipywidgets.interactive(lambda **kwargs: None, **widget_kwargs)
+    # One widget per keyword-argument, in order (`fixed` values included)
+    names = list(widget_kwargs)
+    widgets = controls.kwargs_widgets
+
+    def current_params():
+        return dict(zip(names, (w.value for w in widgets)))
+
+    def as_images(result):
+        return result if isinstance(result, (tuple, list)) else (result,)
+
+    artists = []
+    output = None
+    post = None
+
+    def on_result(result, **params):
+        # Called from the worker thread: GUI objects are not thread-safe
+        post(lambda: show(result))
+
+    def show(result):
+        for artist, image in zip(artists, as_images(result)):
+            artist.set_data(image)
+            if autoscale:
+                artist.autoscale()
+        if output is None:
+            fig.canvas.draw_idle()
+        else:
+            output.clear_output(wait=True)
+            output.append_display_data(fig)
+
+    runner = InteractiveRunner(compute, on_result, debounce=debounce,
+                               cache_size=cache_size, cache_bytes=cache_bytes)
+    images = as_images(runner.evaluate(**current_params()))
+    created = fig is None
+    fig, axes = _subplots(fig, ncols=len(images), squeeze=False,
+                          figsize=(5 * len(images), 5))
+    for ax, image in zip(axes.ravel(), images):
+        artists.append(ax.imshow(image, **(imshow_kwargs or {})))
+    post, runner.draw_timer = _poster(fig)
+
+    # The inline backend only shows figures when a cell finishes, so the
+    # updated figure is re-displayed in an output widget instead.
+    if 'inline' in matplotlib.get_backend():
+        output = ipywidgets.Output()
+        if created:
+            import matplotlib.pyplot as plt
+            plt.close(fig)
+
+    def on_change(change):
+        runner.submit(**current_params())
+
+    for w in widgets:
+        w.observe(on_change, names='value')
+
+    runner.widgets = ipywidgets.VBox([w for w in controls.children
+                                      if w is not controls.out])
+    display(runner.widgets)
+    if output is not None:
+        display(output)
+        output.append_display_data(fig)
+    return runner
@@ -0,0 +1,99 @@
+"""Screen-resolution previews of large images.
+
+Matplotlib resamples every image to the pixel size of its axes anyway, so
+handing it an 8000x6000 array only costs memory and time. The helpers below
+area-average an image down to the pyramid level that still covers the axes
+extent, reading the source in row strips so memory-mapped arrays are never
+loaded in full.
+"""
+from __future__ import division
+
+import numpy as np
+
+
+def float_scale(dtype):
+    """Factor mapping `dtype` values to the `img_as_float` range."""
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer):
+        return 1.0 / np.iinfo(dtype).max
+    return 1.0
+
+
+def pyramid_factor(shape, target_shape):
+    """Largest power-of-two reduction keeping `shape` above `target_shape`.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        (rows, cols) of the full-resolution image.
+    target_shape : tuple of float
+        (rows, cols) in screen pixels of the region the image is drawn into.
+    """
+    factor = 1
+    while all(n / (2 * factor) >= max(t, 1)
+              for n, t in zip(shape[:2], target_shape)):
+        factor *= 2
+    return factor
+
+
+def area_downsample(image, factor, dtype=np.float32, chunk_rows=1024):
+    """ Average `image` over `factor` x `factor` blocks.
+
+    Partial blocks at the bottom and right border are averaged over the
+    pixels they actually contain. The image is processed in strips of about
+    `chunk_rows` source rows, so only one strip is ever converted to `dtype`.
+    """
+    factor = int(factor)
+    height, width = image.shape[:2]
+    out_height = -(-height // factor)
+    out_width = -(-width // factor)
+    out = np.empty((out_height, out_width) + image.shape[2:], dtype=dtype)
+
+    cols = np.arange(0, width, factor)
+    col_counts = np.diff(np.append(cols, width))
+    strip = max(1, chunk_rows // factor)
+    for r0 in range(0, out_height, strip):
+        r1 = min(r0 + strip, out_height)
+        block = image[r0 * factor:min(r1 * factor, height)]
+        rows = np.arange(0, block.shape[0], factor)
+        row_counts = np.diff(np.append(rows, block.shape[0]))
+        acc = np.add.reduceat(block, rows, axis=0, dtype=dtype)
+        acc = np.add.reduceat(acc, cols, axis=1, dtype=dtype)
+        counts = np.outer(row_counts, col_counts).astype(dtype)
+        counts.shape += (1,) * (acc.ndim - 2)
+        np.divide(acc, counts, out=out[r0:r1])
+    return out
+
+
+def streamed_minmax(image, chunk_rows=1024):
+    """Return (min, max) of `image`, reading it `chunk_rows` rows at a time."""
+    lo, hi = np.inf, -np.inf
+    for r0 in range(0, image.shape[0], chunk_rows):
+        chunk = image[r0:r0 + chunk_rows]
+        lo = min(lo, chunk.min())
+        hi = max(hi, chunk.max())
+    return lo, hi
+
+
+def axes_pixel_shape(ax):
+    """Return the (rows, cols) extent of `ax` in screen pixels."""
+    bbox = ax.get_window_extent()
+    return bbox.height, bbox.width
+
+
+def screen_preview(image, ax, dtype=np.float32):
+    """ Return the pyramid level of `image` that fits the extent of `ax`.
+
+    The result is scaled like `img_as_float` so that previews of integer and
+    float images share a common intensity range.
+    """
+    image = np.asanyarray(image)
+    factor = pyramid_factor(image.shape, axes_pixel_shape(ax))
+    if factor == 1:
+        preview = image.astype(dtype)
+    else:
+        preview = area_downsample(image, factor, dtype=dtype)
+    scale = float_scale(image.dtype)
+    if scale != 1:
+        preview *= scale
+    return preview
@@ -0,0 +1,228 @@
+"""Stage-level timing and memory instrumentation.
+
+Wrap the stages of a pipeline with `profile`, as a context manager or a
+decorator::
+
+    skdemo.enable_profiling()
+    with skdemo.profile('stitch'):
+        with skdemo.profile('orb'):
+            ...
+        with skdemo.profile('ransac'):
+            ...
+    print(skdemo.profile_report())
+
+While profiling is disabled (the default), entering a stage only checks a
+flag, so the instrumentation can stay in production code. Set the
+environment variable SKDEMO_PROFILE=1 to enable it at import time.
+"""
+from __future__ import division
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+
+
+__all__ = ['profile', 'enable_profiling', 'disable_profiling',
+           'profile_report', 'reset_profile']
+
+
+class _Config(object):
+    enabled = False
+    memory = True
+    large_array_bytes = 2**20
+    started_tracing = False
+
+
+_config = _Config()
+_records = OrderedDict()   # stage path -> _StageRecord
+_records_lock = threading.Lock()
+_local = threading.local()  # per-thread stack of open stages
+
+# tracemalloc domain of the NumPy data allocations
+_NUMPY_DOMAIN = np.lib.tracemalloc_domain
+
+
+class _StageRecord(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+        self.wall = 0.
+        self.cpu = 0.
+        self.peak = 0
+        self.large_arrays = 0
+
+    def as_dict(self):
+        return OrderedDict([('stage', '/'.join(self.path)),
+                            ('calls', self.calls),
+                            ('wall_s', self.wall),
+                            ('cpu_s', self.cpu),
+                            ('peak_bytes', self.peak),
+                            ('large_arrays', self.large_arrays)])
+
+
+def enable_profiling(memory=True, large_array_bytes=2**20):
+    """ Start recording the stages entered with `profile`.
+
+    Parameters
+    ----------
+    memory : bool
+        Also trace memory with `tracemalloc`: the peak allocated during each
+        stage and the number of NumPy arrays of at least `large_array_bytes`
+        it allocated and still holds at its end. This slows allocations
+        down noticeably; timings alone are almost free.
+    """
+    _config.memory = memory
+    _config.large_array_bytes = large_array_bytes
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _config.started_tracing = True
+    _config.enabled = True
+
+
+def disable_profiling():
+    """Stop recording stages; recorded results are kept."""
+    _config.enabled = False
+    if _config.started_tracing:
+        tracemalloc.stop()
+        _config.started_tracing = False
+
+
+def reset_profile():
+    """Forget all recorded stages."""
+    with _records_lock:
+        _records.clear()
+
+
+def _numpy_snapshot():
+    return tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.DomainFilter(True, _NUMPY_DOMAIN)])
+
+
+class profile(object):
+    """ Record wall time, CPU time and memory of a named pipeline stage.
+
+    Use as a context manager (``with profile('name'):``) or as a decorator
+    (``@profile()`` or ``@profile('name')``; the function's qualified name
+    is used by default, and '<block>' for an unnamed context manager).
+    Stages opened inside another stage are recorded as its children.
+    Repeated calls of a stage are accumulated.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+
+    def __call__(self, func):
+        name = self.name or getattr(func, '__qualname__', func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _config.enabled:
+                return func(*args, **kwargs)
+            with profile(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        if not _config.enabled:
+            self._frame = None
+            return self
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        parent = stack[-1] if stack else None
+        path = (parent['path'] if parent else ()) + (self.name or '<block>',)
+        frame = {'path': path, 'snapshot': None}
+
+        tracing = _config.memory and tracemalloc.is_tracing()
+        if tracing:
+            peak = tracemalloc.get_traced_memory()[1]
+            if parent is not None:
+                parent['peak'] = max(parent['peak'], peak)
+            # Snapshots allocate a lot: keep them out of every peak window
+            frame['snapshot'] = _numpy_snapshot()
+            tracemalloc.reset_peak()
+            frame['start_memory'] = frame['peak'] = \
+                tracemalloc.get_traced_memory()[0]
+        frame['tracing'] = tracing
+        frame['cpu'] = time.process_time()
+        frame['wall'] = time.perf_counter()
+        stack.append(frame)
+        self._frame = frame
+        return self
+
+    def __exit__(self, *exc_info):
+        frame = self._frame
+        if frame is None:
+            return False
+        wall = time.perf_counter() - frame['wall']
+        cpu = time.process_time() - frame['cpu']
+        _local.stack.pop()
+
+        peak = large_arrays = 0
+        if frame['tracing'] and tracemalloc.is_tracing():
+            frame['peak'] = max(frame['peak'],
+                                tracemalloc.get_traced_memory()[1])
+            peak = frame['peak'] - frame['start_memory']
+            diff = _numpy_snapshot().compare_to(frame['snapshot'], 'traceback')
+            large_arrays = sum(
+                stat.count_diff for stat in diff
+                if stat.count_diff > 0 and stat.size_diff >=
+                stat.count_diff * _config.large_array_bytes)
+            del diff
+            tracemalloc.reset_peak()
+            if _local.stack:
+                parent = _local.stack[-1]
+                parent['peak'] = max(parent['peak'], frame['peak'])
+
+        with _records_lock:
+            record = _records.get(frame['path'])
+            if record is None:
+                record = _records[frame['path']] = _StageRecord(frame['path'])
+            record.calls += 1
+            record.wall += wall
+            record.cpu += cpu
+            record.peak = max(record.peak, peak)
+            record.large_arrays += large_arrays
+        return False
+
+
+def profile_report(format='table'):
+    """ Summarize the recorded stages.
+
+    Parameters
+    ----------
+    format : {'table', 'json', 'records'}
+        'table' returns a text table with children indented below their
+        parent stage, 'json' a JSON string, and 'records' a list of dicts.
+    """
+    with _records_lock:
+        records = [r.as_dict() for r in
+                   sorted(_records.values(), key=lambda r: r.path)]
+    if format == 'records':
+        return records
+    if format == 'json':
+        return json.dumps(records, indent=2)
+    if format != 'table':
+        raise ValueError('Unknown report format: {!r}'.format(format))
+
+    header = '{:<40} {:>6} {:>10} {:>10} {:>10} {:>8}'.format(
+        'stage', 'calls', 'wall [s]', 'cpu [s]', 'peak [MB]', 'arrays')
+    lines = [header, '-' * len(header)]
+    for r in records:
+        path = r['stage'].split('/')
+        name = '  ' * (len(path) - 1) + path[-1]
+        lines.append('{:<40} {:>6} {:>10.4f} {:>10.4f} {:>10.1f} {:>8}'.format(
+            name, r['calls'], r['wall_s'], r['cpu_s'],
+            r['peak_bytes'] / 2**20, r['large_arrays']))
+    return '\n'.join(lines)
+
+
+if os.environ.get('SKDEMO_PROFILE'):
+    enable_profiling()
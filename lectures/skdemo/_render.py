@@ -0,0 +1,53 @@
+"""Headless figure rendering without pyplot."""
+from __future__ import division
+
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+__all__ = ['render_figure', 'render_batch']
+
+
+def render_figure(filename, func, args=(), kwargs=None, dpi=100):
+    """ Draw `func(*args, fig=fig, **kwargs)` on an Agg canvas and save it.
+
+    The figure is created without pyplot, so nothing is registered in the
+    global figure manager and calls can run concurrently. `func` is any
+    skdemo helper accepting a `fig` keyword-argument (or a function with
+    the same convention).
+
+    Returns
+    -------
+    filename : str
+    """
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    func(*args, fig=fig, **(kwargs or {}))
+    fig.savefig(filename, dpi=dpi)
+    return filename
+
+
+def render_batch(jobs, processes=None, dpi=100):
+    """ Render many figures to image files from a process pool.
+
+    Parameters
+    ----------
+    jobs : iterable of tuple
+        `(filename, func, args, kwargs)` tuples as taken by `render_figure`.
+        `func` and its arguments must be picklable, e.g. module-level
+        functions such as `skdemo.show_segmentation`.
+    processes : int or None
+        Number of worker processes, by default the number of CPUs.
+
+    Returns
+    -------
+    filenames : list of str
+        Written files, in the order of `jobs`.
+    """
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(render_figure, filename, func, args, kwargs,
+                               dpi=dpi)
+                   for filename, func, args, kwargs in jobs]
+        return [future.result() for future in futures]
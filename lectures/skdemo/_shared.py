@@ -0,0 +1,253 @@
+"""Pass NumPy arrays to worker processes through shared memory.
+
+Instead of pickling images into and out of a process pool, the parent puts
+them in `SharedArray` blocks and sends small `ArrayDescriptor` tuples
+(block name, shape, dtype and an optional slice). Workers map the blocks
+and read or write the pixels in place::
+
+    def smooth_plane(src, dst, sigma):
+        dst[...] = filters.gaussian(src, sigma)
+
+    with SharedArray.from_array(volume) as src, \\
+            SharedArray(volume.shape, np.float64) as dst, \\
+            ProcessPoolExecutor() as pool:
+        futures = [pool.submit(call_with_arrays, smooth_plane,
+                               src.descriptor(z), dst.descriptor(z), 2)
+                   for z in range(len(volume))]
+        for future in futures:
+            future.result()
+        result = dst.array.copy()
+
+Blocks are owned by the process that creates them. They are unlinked when
+released (explicitly, at the end of a ``with`` block, when garbage
+collected or at exit), also when a worker crashed and the pool raised
+`BrokenProcessPool`. Workers only map blocks, so a crashing worker leaks
+nothing; if the owner itself is killed, Python's resource tracker unlinks
+its blocks.
+"""
+from __future__ import division
+
+import os
+import sys
+import threading
+import weakref
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+__all__ = ['SharedArray', 'ArrayDescriptor', 'attach', 'detach_all',
+           'call_with_arrays']
+
+
+class ArrayDescriptor(namedtuple('ArrayDescriptor',
+                                 ['name', 'shape', 'dtype', 'index'])):
+    """ Picklable reference to (part of) a `SharedArray`.
+
+    `index` is None or a basic index (integers and slices) applied to the
+    array of shape `shape` and dtype `dtype` held by block `name`.
+    """
+    __slots__ = ()
+
+
+# Blocks created by this process, by name
+_owned = weakref.WeakValueDictionary()
+
+# Blocks mapped by `attach`, by name
+_attached = {}
+
+# Blocks mapped by `call_with_arrays` that could not be closed yet
+_deferred = []
+
+_tracker_lock = threading.Lock()
+
+
+def _release(shm, pid):
+    try:
+        shm.close()
+    except BufferError:
+        # Views are still alive: the mapping goes away with them
+        pass
+    if os.getpid() != pid:
+        # A forked child inherited the object: the block is not its own
+        return
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class SharedArray(object):
+    """ NumPy array in a shared-memory block owned by this process.
+
+    Parameters
+    ----------
+    shape : tuple of int
+    dtype : dtype
+    fill : scalar
+        Initial value; by default the memory is zeroed by the system.
+
+    Attributes
+    ----------
+    array : ndarray
+        The array, backed by the shared block.
+    """
+
+    def __init__(self, shape, dtype=np.float64, fill=None):
+        shape = tuple(int(n) for n in np.atleast_1d(shape))
+        dtype = np.dtype(dtype)
+        if dtype.hasobject:
+            raise TypeError('Object arrays cannot be shared')
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        self._shm = shared_memory.SharedMemory(create=True,
+                                               size=max(nbytes, 1))
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf)
+        if fill is not None:
+            self.array.fill(fill)
+        self._pid = os.getpid()
+        self._finalizer = weakref.finalize(self, _release, self._shm,
+                                           self._pid)
+        _owned[self.name] = self
+
+    @classmethod
+    def from_array(cls, array):
+        """Shared copy of `array`."""
+        array = np.asarray(array)
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def dtype(self):
+        return self.array.dtype
+
+    def descriptor(self, index=None):
+        """`ArrayDescriptor` of the array, or of ``array[index]``."""
+        if not self._finalizer.alive:
+            raise ValueError('SharedArray has been released')
+        return ArrayDescriptor(self.name, self.array.shape,
+                               self.array.dtype.str, index)
+
+    def release(self):
+        """Unmap and unlink the block; views of `array` become invalid."""
+        self.array = None
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+    def __repr__(self):
+        return 'SharedArray(name={!r}, shape={}, dtype={})'.format(
+            self.name, self.shape, self.dtype)
+
+
+def _open_block(name):
+    """Map an existing block without taking ownership of it."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    from multiprocessing import resource_tracker
+
+    # Before Python 3.13, mapping a block also registers it with the
+    # resource tracker, which is shared with the owner: unregistering it
+    # afterwards would drop the owner's registration too.
+    with _tracker_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+def _owner(name):
+    """Live `SharedArray` created by this very process, if any."""
+    owner = _owned.get(name)
+    if owner is None or owner.array is None or owner._pid != os.getpid():
+        return None
+    return owner
+
+
+def _view(descriptor, buffer):
+    array = np.ndarray(descriptor.shape, dtype=np.dtype(descriptor.dtype),
+                       buffer=buffer)
+    return array if descriptor.index is None else array[descriptor.index]
+
+
+def attach(descriptor):
+    """ Array described by `descriptor`, in any process.
+
+    In the owner process this is a view of the `SharedArray`. Elsewhere the
+    block is mapped and stays mapped in this process until `detach_all`;
+    worker functions should rather be run through `call_with_arrays`, which
+    unmaps the blocks after each call.
+    """
+    owner = _owner(descriptor.name)
+    if owner is not None:
+        return _view(descriptor, owner._shm.buf)
+    shm = _attached.get(descriptor.name)
+    if shm is None:
+        shm = _attached[descriptor.name] = _open_block(descriptor.name)
+    return _view(descriptor, shm.buf)
+
+
+def detach_all():
+    """Unmap the blocks mapped by `attach` whose views are all gone."""
+    for name, shm in list(_attached.items()):
+        if not _try_close([shm]):
+            del _attached[name]
+
+
+def _try_close(blocks):
+    still_open = []
+    for shm in blocks:
+        try:
+            shm.close()
+        except BufferError:
+            still_open.append(shm)
+    return still_open
+
+
+def call_with_arrays(func, *args, **kwargs):
+    """ Call `func` with the `ArrayDescriptor` arguments attached as arrays.
+
+    Meant to be submitted to a process pool: descriptors (positional or
+    keyword, not nested) are replaced by their arrays, the blocks are
+    mapped for the duration of the call and unmapped afterwards. `func`
+    should write its results into output arrays passed the same way rather
+    than return large arrays.
+    """
+    global _deferred
+    _deferred = _try_close(_deferred)
+
+    opened = {}
+
+    def resolve(value):
+        if not isinstance(value, ArrayDescriptor):
+            return value
+        owner = _owner(value.name)
+        if owner is not None:
+            return _view(value, owner._shm.buf)
+        if value.name not in opened:
+            opened[value.name] = _open_block(value.name)
+        return _view(value, opened[value.name].buf)
+
+    args = [resolve(a) for a in args]
+    kwargs = dict((k, resolve(v)) for k, v in kwargs.items())
+    try:
+        return func(*args, **kwargs)
+    finally:
+        del args, kwargs
+        _deferred.extend(_try_close(opened.values()))
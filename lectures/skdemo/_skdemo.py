@@ -1,32 +1,101 @@
 from __future__ import division
 
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
 from mpl_toolkits import axes_grid1 # For colorbars
 
-from scipy.ndimage import grey_dilation
-
-from skimage import img_as_float
 from skimage import color
-from skimage import exposure
 from skimage.util.dtype import dtype_limits
 
-from matplotlib.colors import NoNorm, BoundaryNorm, ListedColormap
+from . import _preview
+from ._histogram import channel_histograms
+from ._overlay import boundary_overlay, composite_labels, label_palette
+from ._cache import LRUCache
+from ._windows import bounded_slice, box_sum
+from ._util import iter_channels
+
+from matplotlib.colors import BoundaryNorm, ListedColormap
 from matplotlib import cm
 from matplotlib.cm import ScalarMappable, get_cmap
+from matplotlib.ticker import MaxNLocator
 
 
 __all__ = ['imshow_all', 'imshow_with_histogram', 'mean_filter_demo',
-           'mean_filter_interactive_demo', 'plot_cdf', 'plot_histogram', 
+           'mean_filter_interactive_demo', 'MeanFilterSteps', 'plot_cdf', 'plot_histogram', 
            'colorbars','add_colorbar','match_axes_height', 
            'scatter_matrix', 'force_integer_ticks',
-           'discrete_cmap', 'discrete_colorbar', 
-           'show_segmentation', 'show_features']
+           'discrete_colorbar', 
+           'show_segmentation', 'show_features',
+           'set_precision', 'get_precision']
 
 
 # Gray-scale images should actually be gray!
 plt.rcParams['image.cmap'] = 'gray'
 
+# Working precision of the float images built by the helpers below.
+# 'float32' halves memory compared with `img_as_float`, 'native' keeps the
+# input dtype where the image is only displayed.
+_precision = 'float32'
+
+
+def set_precision(precision):
+    """ Set the working precision of all skdemo helpers.
+
+    Parameters
+    ----------
+    precision : {'float32', 'float64', 'native'}
+        Float type used when converting images. With 'native', images that
+        are only displayed keep their dtype, and float32 is used where
+        arithmetic is needed. Every helper also accepts a `precision`
+        keyword-argument overriding this setting for one call.
+    """
+    global _precision
+    if precision not in ('float32', 'float64', 'native'):
+        raise ValueError('Unknown precision: {!r}'.format(precision))
+    _precision = precision
+
+
+def get_precision():
+    """Return the working precision set with `set_precision`."""
+    return _precision
+
+
+def _float_dtype(precision=None):
+    """Float dtype to compute with under `precision`."""
+    precision = precision or _precision
+    return np.dtype('float32' if precision == 'native' else precision)
+
+
+def _as_float(image, precision=None):
+    """ Convert `image` to the working float precision.
+
+    Integer images are scaled to the `img_as_float` range; images that
+    already have the working dtype are returned without a copy.
+    """
+    image = np.asanyarray(image)
+    dtype = _float_dtype(precision)
+    if image.dtype == dtype:
+        return image
+    scale = _preview.float_scale(image.dtype)
+    image = image.astype(dtype)
+    if scale != 1:
+        image *= scale
+    return image
+
+
+def _subplots(fig=None, figsize=None, **kwargs):
+    """ `plt.subplots`, or the same grid added to an existing `fig`.
+
+    Passing a `Figure` (e.g. on an Agg canvas) keeps pyplot's global state
+    out of the way, so figures can be rendered concurrently.
+    """
+    if fig is None:
+        return plt.subplots(figsize=figsize, **kwargs)
+    if figsize is not None:
+        fig.set_size_inches(figsize)
+    return fig, fig.subplots(**kwargs)
+
 
 #--------------------------------------------------------------------------
 #  Custom `imshow` functions
@@ -62,20 +131,61 @@ def imshow_all(*images, **kwargs):
         Control the intensity limits. By default, 'image' is used set the
         min/max intensities to the min/max of all images. Setting `limits` to
         'dtype' can also be used if you want to preserve the image exposure.
+        With `preview=True`, 'preview' takes the min/max of the displayed
+        previews instead of scanning the full-resolution images.
     titles : list of str
         Titles for subplots. If the length of titles is less than the number
         of images, empty strings are appended.
+    preview : bool
+        If True, draw area-averaged previews sized to the axes extent at the
+        figure DPI instead of full-resolution float copies. Use this for
+        images much larger than the screen.
+    precision : {'float32', 'float64', 'native'}
+        Override the module precision (see `set_precision`). 'native' draws
+        the images unconverted if they all share the same dtype.
+    fig : `Figure`
+        Figure to draw into instead of a new pyplot figure.
     kwargs : dict
         Additional keyword-arguments passed to `imshow`.
+
+    Returns
+    -------
+    axes : array of `Axes`
     """
-    images = [img_as_float(img) for img in images]
+    fig = kwargs.pop('fig', None)
+    preview = kwargs.pop('preview', False)
+    precision = kwargs.pop('precision', None) or _precision
+    if precision == 'native' and len(set(img.dtype for img in images)) > 1:
+        precision = 'float32'
+    if not preview and precision != 'native':
+        images = [_as_float(img, precision) for img in images]
 
     titles = kwargs.pop('titles', [])
     if len(titles) != len(images):
         titles = list(titles) + [''] * (len(images) - len(titles))
 
+    nrows, ncols = kwargs.pop('shape', (1, len(images)))
+
+    size = nrows * kwargs.pop('size', 5)
+    width = size * len(images)
+    if nrows > 1:
+        width /= nrows * 1.33
+    fig, axes = _subplots(fig, nrows=nrows, ncols=ncols, figsize=(width, size),
+                          squeeze=False)
+
     limits = kwargs.pop('limits', 'image')
-    if limits == 'image':
+    if limits == 'image' and preview:
+        # Stream over the full-resolution images before they are replaced
+        # by their previews.
+        bounds = [_preview.streamed_minmax(img) for img in images]
+        scales = [_preview.float_scale(img.dtype) for img in images]
+        kwargs.setdefault('vmin', min(lo * s for (lo, _), s in zip(bounds, scales)))
+        kwargs.setdefault('vmax', max(hi * s for (_, hi), s in zip(bounds, scales)))
+    if preview:
+        images = [_preview.screen_preview(img, ax, _float_dtype(precision))
+                  for img, ax in zip(images, axes.ravel())]
+
+    if limits in ('image', 'preview'):
         kwargs.setdefault('vmin', min(img.min() for img in images))
         kwargs.setdefault('vmax', max(img.max() for img in images))
     elif limits == 'dtype':
@@ -83,19 +193,13 @@ def imshow_all(*images, **kwargs):
         kwargs.setdefault('vmin', vmin)
         kwargs.setdefault('vmax', vmax)
 
-    nrows, ncols = kwargs.get('shape', (1, len(images)))
-
-    size = nrows * kwargs.pop('size', 5)
-    width = size * len(images)
-    if nrows > 1:
-        width /= nrows * 1.33
-    fig, axes = plt.subplots(nrows=nrows, ncols=ncols, figsize=(width, size))
     for ax, img, label in zip(axes.ravel(), images, titles):
         ax.imshow(img, **kwargs)
         ax.set_title(label)
+    return axes
 
 
-def imshow_with_histogram(image, xlim=None, **kwargs):
+def imshow_with_histogram(image, xlim=None, fig=None, **kwargs):
     """ Plot an image side-by-side with its histogram.
 
     - Plot the image next to the histogram
@@ -105,10 +209,10 @@ def imshow_with_histogram(image, xlim=None, **kwargs):
 
     See `plot_histogram` for information on how the histogram is plotted.
     """
-    width, height = plt.rcParams['figure.figsize']
-    fig, (ax_image, ax_hist) = plt.subplots(ncols=2, figsize=(2*width, height))
+    width, height = matplotlib.rcParams['figure.figsize']
+    fig, (ax_image, ax_hist) = _subplots(fig, ncols=2, figsize=(2*width, height))
 
-    kwargs.setdefault('cmap', plt.cm.gray)
+    kwargs.setdefault('cmap', 'gray')
     ax_image.imshow(image, **kwargs)
     plot_histogram(image, ax=ax_hist, xlim=xlim)
 
@@ -129,10 +233,11 @@ def add_colorbar(im, aspect=20, pad_fraction=0.5, **kwargs):
     divider = axes_grid1.make_axes_locatable(im.axes)
     width = axes_grid1.axes_size.AxesY(im.axes, aspect=1./aspect)
     pad = axes_grid1.axes_size.Fraction(pad_fraction, width)
-    current_ax = plt.gca()
+    fig = im.axes.figure
+    current_ax = fig.gca()
     cax = divider.append_axes("right", size=width, pad=pad)
-    plt.sca(current_ax)
-    return im.axes.figure.colorbar(im, cax=cax, **kwargs)
+    fig.sca(current_ax)
+    return fig.colorbar(im, cax=cax, **kwargs)
 
 def colorbars(axes=None, fig=None, return_handles=False, 
               aspect=20, pad_fraction=0.5, **kwargs):
@@ -170,20 +275,35 @@ def colorbars(axes=None, fig=None, return_handles=False,
     else: 
         return
 
+def _active_position(ax):
+    """Position of `ax` once its aspect and axes locator apply, without drawing."""
+    locator = ax.get_axes_locator()
+    ax.apply_aspect(locator(ax, None) if locator else None)
+    return ax.get_position()
+
+
 def match_axes_height(ax_src, ax_dst):
     """ Match the axes height of two axes objects.
 
-    The height of `ax_dst` is synced to that of `ax_src`.
+    The height of `ax_dst` is synced to that of `ax_src`. The geometry is
+    resolved from the aspect and locators of the axes, so no draw of the
+    figure is needed.
     """
-    # HACK: plot geometry isn't set until the plot is drawn
-    plt.draw()
-    dst = ax_dst.get_position()
-    src = ax_src.get_position()
+    dst = _active_position(ax_dst)
+    src = _active_position(ax_src)
     ax_dst.set_position([dst.xmin, src.ymin, dst.width, src.height])
 
 
 def plot_cdf(image, ax=None, xlim=None):
-    img_cdf, bins = exposure.cumulative_distribution(image)
+    """ Plot the cumulative distribution of `image` intensities on `ax`.
+
+    The CDF is the normalized cumulative sum of the cached histogram, so
+    calling this right after `plot_histogram` does not rescan the pixels.
+    """
+    ax = ax if ax is not None else plt.gca()
+    hist, bins = channel_histograms(image, cache=True)
+    img_cdf = hist.sum(axis=0).cumsum()
+    img_cdf = img_cdf / float(img_cdf[-1])
     ax.plot(bins, img_cdf, 'r')
     ax.set_ylabel("Fraction of pixels below intensity")
     if (xlim is None):
@@ -196,19 +316,19 @@ def plot_cdf(image, ax=None, xlim=None):
 def plot_histogram(image, ax=None, xlim=None, **kwargs):
     """ Plot the histogram of an image (gray-scale or RGB) on `ax`.
 
-    Calculate histogram using `skimage.exposure.histogram` and plot as filled
-    line. If an image has a 3rd dimension, assume it's RGB and plot each
-    channel separately.
+    Calculate the histograms of all channels in one pass with
+    `channel_histograms` (cached, see `plot_cdf`) and plot each as a filled
+    line. If an image has a
+    3rd dimension, assume it's RGB and plot each channel separately.
     """
     ax = ax if ax is not None else plt.gca()
-    
 
-    if image.ndim == 2:
-        _plot_histogram(ax, image, color='black', **kwargs)
-    elif image.ndim == 3:
-        # `channel` is the red, green, or blue channel of the image.
-        for channel, channel_color in zip(iter_channels(image), 'rgb'):
-            _plot_histogram(ax, channel, color=channel_color, **kwargs)
+    hist, bin_centers = channel_histograms(image, cache=True)
+    channel_colors = ['black'] if image.ndim == 2 else 'rgb'
+    # `channel_hist` is the histogram of the red, green, or blue channel.
+    for channel_hist, channel_color in zip(hist, channel_colors):
+        _plot_histogram(ax, channel_hist, bin_centers, color=channel_color,
+                        **kwargs)
 
     if (xlim is None):
         if (image.dtype=='uint8'):
@@ -217,109 +337,102 @@ def plot_histogram(image, ax=None, xlim=None, **kwargs):
         ax.set_xlim(xlim[0],xlim[1])
 
 
-def _plot_histogram(ax, image, alpha=0.3, **kwargs):
-    # Use skimage's histogram function which has nice defaults for
-    # integer and float images.
-    hist, bin_centers = exposure.histogram(image)
+def _plot_histogram(ax, hist, bin_centers, alpha=0.3, **kwargs):
+    # Histograms come from `channel_histograms`, which has the same
+    # defaults as skimage's histogram function for integer and float images.
     ax.fill_between(bin_centers, hist, alpha=alpha, **kwargs)
     ax.set_xlabel('intensity')
     ax.set_ylabel('# pixels')
 
 
-def iter_channels(color_image):
-    """Yield color channels of an image."""
-    # Roll array-axis so that we iterate over the color channels of an image.
-    for channel in np.rollaxis(color_image, -1):
-        yield channel
-
-
 #--------------------------------------------------------------------------
 #  Convolution Demo
 #--------------------------------------------------------------------------
 
-def mean_filter_demo(image, vmax=1):
-    mean_factor = 1.0 / 9.0  # This assumes a 3x3 kernel.
-    iter_kernel_and_subimage = iter_kernel(image)
-
-    image_cache = []
+class MeanFilterSteps(object):
+    """ Random access to the intermediate states of a 3x3 mean filter.
 
-    def mean_filter_step(i_step):
-        while i_step >= len(image_cache):
-            filtered = image if i_step == 0 else image_cache[-1][1]
-            filtered = filtered.copy()
+    Step `k` is the image after the mean filter was applied to the first
+    `k + 1` pixels in raster order. It is assembled directly from a
+    precomputed (integral image) mean filter for the pixels up to `k` and
+    the original values after it, so any step costs the same no matter
+    which step was shown before. Rendered frames are kept in an LRU cache
+    bounded to `cache_bytes`.
+    """
 
-            (i, j), mask, subimage = iter_kernel_and_subimage.next()
-            filter_overlay = color.label2rgb(mask, image, bg_label=0,
+    def __init__(self, image, size=1, cache_bytes=2**28, precision=None):
+        self.image = image
+        self.size = size
+        mean_factor = 1.0 / (2*size + 1)**2
+        # The integral image grows with the image size: accumulate exactly
+        # (or in double precision) and only round the means
+        accumulate = np.int64 if image.dtype.kind in 'biu' else np.float64
+        sums = box_sum(image, size=size, dtype=accumulate)
+        self.filtered = (sums * mean_factor).astype(_float_dtype(precision),
+                                                    copy=False)
+        self._frames = LRUCache(maxsize=None, maxbytes=cache_bytes)
+
+    def __len__(self):
+        return self.image.shape[0] * self.image.shape[1]
+
+    def state(self, i_step):
+        """Filtered image after step `i_step`."""
+        i, j = np.unravel_index(i_step, self.image.shape[:2])
+        filtered = self.image.copy()
+        filtered[:i] = self.filtered[:i]
+        filtered[i, :j+1] = self.filtered[i, :j+1]
+        return filtered
+
+    def mask(self, i_step):
+        """Kernel mask of step `i_step`: 2 at the center and 1 around it."""
+        i, j = np.unravel_index(i_step, self.image.shape[:2])
+        mask = np.zeros(self.image.shape[:2], dtype='int16')
+        mask[bounded_slice((i, j), mask.shape, size=self.size)] = 1
+        mask[i, j] = 2
+        return mask
+
+    def frame(self, i_step):
+        """Return the (kernel overlay, filtered image) pair of `i_step`."""
+        frame = self._frames.get(i_step)
+        if frame is None:
+            filter_overlay = color.label2rgb(self.mask(i_step), self.image,
+                                             bg_label=0,
                                              colors=('yellow', 'red'))
-            filtered[i, j] = np.sum(mean_factor * subimage)
-            image_cache.append((filter_overlay, filtered))
+            frame = (filter_overlay, self.state(i_step))
+            self._frames[i_step] = frame
+        return frame
 
-        imshow_all(*image_cache[i_step], vmax=vmax)
-        plt.show()
-    return mean_filter_step
 
+def mean_filter_demo(image, vmax=1, cache_bytes=2**28):
+    steps = MeanFilterSteps(image, cache_bytes=cache_bytes)
 
-def mean_filter_interactive_demo(image):
-    from IPython.html import widgets
-    mean_filter_step = mean_filter_demo(image)
-    step_slider = widgets.IntSliderWidget(min=0, max=image.size-1, value=0)
-    widgets.interact(mean_filter_step, i_step=step_slider)
+    def mean_filter_step(i_step):
+        imshow_all(*steps.frame(i_step), vmax=vmax)
+        plt.show()
+    return mean_filter_step
 
 
-def iter_kernel(image, size=1):
-    """ Yield position, kernel mask, and image for each pixel in the image.
+def mean_filter_interactive_demo(image, vmax=1):
+    """ Step through the mean filter with a slider.
 
-    The kernel mask has a 2 at the center pixel and 1 around it. The actual
-    width of the kernel is 2*size + 1.
+    Frames are computed on a worker thread and drawn by updating the two
+    existing images, see `skdemo.interactive`.
     """
-    width = 2*size + 1
-    for (i, j), pixel in iter_pixels(image):
-        mask = np.zeros(image.shape, dtype='int16')
-        mask[i, j] = 1
-        mask = grey_dilation(mask, size=width)
-        mask[i, j] = 2
-        subimage = image[bounded_slice((i, j), image.shape[:2], size=size)]
-        yield (i, j), mask, subimage
-
-
-def iter_pixels(image):
-    """ Yield pixel position (row, column) and pixel intensity. """
-    height, width = image.shape[:2]
-    for i in range(height):
-        for j in range(width):
-            yield (i, j), image[i, j]
+    from ipywidgets import IntSlider
+    from ._interactive import interactive
+    steps = MeanFilterSteps(image)
+    step_slider = IntSlider(min=0, max=len(steps)-1, value=0)
+    # `steps` already keeps an LRU of rendered frames
+    return interactive(steps.frame, cache_size=1, autoscale=False,
+                       imshow_kwargs=dict(vmin=0, vmax=vmax),
+                       i_step=step_slider)
 
 
-def bounded_slice(center, xy_max, size=1, i_min=0):
-    slices = []
-    for i, i_max in zip(center, xy_max):
-        slices.append(slice(max(i - size, i_min), min(i + size + 1, i_max)))
-    return slices
-    
 #-------------------------------------------------------------------------
 # Classification demo
 #-------------------------------------------------------------------------
 
-from matplotlib.colors import Normalize, colorConverter
-
-def discrete_cmap(N=8, colors=None, cmap='viridis', norm=None, 
-                  use_bounds=False, zero=None):
-    if (colors is None):
-        if (norm is None):
-            if (use_bounds):
-                norm=Normalize(vmin=0, vmax=N-1)
-            else:
-                norm=Normalize(vmin=-0.5, vmax=N-0.5)
-        sm=cm.ScalarMappable(cmap=cmap,norm=norm)
-        cols=sm.to_rgba(range(N))[:,:3]
-    else:
-        cols=colors
-        N=len(colors) # Number of rows
-    
-    if (zero is not None):
-        zcol=colorConverter.to_rgb(zero)
-        cols=np.insert(cols,0,zcol, axis=0)
-    return ListedColormap(cols)
+from matplotlib.colors import Normalize
 
 def discrete_colorbar(colors, labels=None, ax=None, cax=None):
     """
@@ -331,25 +444,65 @@ def discrete_colorbar(colors, labels=None, ax=None, cax=None):
         
         labels: list of tick labels
             assume ticks are at range(len(labels))
+
+        ax, cax: Axes (or list of Axes) used as in `Figure.colorbar`.
+            The colorbar is added to their figure, or to the current
+            pyplot figure if both are None.
     """
     N=len(colors)
     vmin=0; vmax=N-1;
     norm = BoundaryNorm(np.arange(-0.5+vmin,vmax+1.5,1), N)
     s=ScalarMappable(norm=norm, cmap=ListedColormap(colors))
     s.set_array(range(N))
-    cb=plt.colorbar(mappable=s, ticks=range(vmin,vmax+1), ax=ax, cax=cax)
-    cb.set_norm(norm)
-    plt.clim(-0.5+vmin, vmax + 0.5)
-    cbticks = plt.getp(cb.ax.axes, 'yticklines')
-    plt.setp(cbticks, visible=False)
+    s.set_clim(-0.5+vmin, vmax + 0.5)
+    if (cax is not None):
+        fig = cax.figure
+    elif (ax is not None):
+        fig = np.ravel(ax)[0].figure
+    else:
+        fig = plt.gcf()
+    cb=fig.colorbar(mappable=s, ticks=range(vmin,vmax+1), ax=ax, cax=cax)
+    for line in cb.ax.get_yticklines():
+        line.set_visible(False)
     if (labels is not None):
         cb.set_ticklabels(labels)
     return cb
     
+def _bin_indices(data, bins):
+    """Bin index of every sample along each feature, with the bin ranges."""
+    vmins = data.min(axis=0)
+    vmaxs = data.max(axis=0)
+    spans = np.where(vmaxs > vmins, vmaxs - vmins, 1)
+    idx = ((data - vmins) * (bins / spans)).astype(np.intp)
+    np.clip(idx, 0, bins - 1, out=idx)
+    return idx, vmins, vmaxs
+
+
+def _density_image(counts, cols):
+    """RGBA image of per-class counts: mean class color, log-density alpha."""
+    total = counts.sum(axis=0)
+    rgba = np.zeros(total.shape + (4,))
+    rgba[..., :3] = np.tensordot(counts, cols, axes=(0, 0))
+    occupied = total > 0
+    rgba[occupied, :3] /= total[occupied, None]
+    rgba[..., 3] = np.log1p(total) / np.log1p(max(total.max(), 1))
+    return rgba
+
+
 def scatter_matrix(data, c=None, labels=None, title=None, cmap='viridis', norm=None,
-                  figsize=(6,4), show_colorbar=False, class_labels=None):
+                  figsize=(6,4), show_colorbar=False, class_labels=None,
+                  density=False, bins=64, fig=None):
     '''
     Equivalent of pandas.scatter_matrix or seaborne.pairplot
+
+    With `density=True`, samples are aggregated into `bins` x `bins`
+    per-class count grids (one `np.bincount` per feature pair) that are
+    drawn as images, and the diagonal histograms of all features and
+    classes come from a single `np.bincount`. Rendering time then depends
+    on `bins` instead of the number of samples, which is needed for
+    per-pixel features of whole images.
+
+    Pass a `Figure` as `fig` to draw into it instead of a pyplot figure.
     '''
     from matplotlib import cm
     nb_features = data.shape[1]
@@ -360,8 +513,9 @@ def scatter_matrix(data, c=None, labels=None, title=None, cmap='viridis', norm=N
     if (data.shape[0]<data.shape[1]):
         print('Warning: multi_scatter received data of shape: nb_samples={}, nb_features={}. If not as intended, please transpose data'.format(data.shape[0],data.shape[1]))
         
-    fig, axes = plt.subplots(nb_features,nb_features, figsize=figsize, sharex='col', #sharey='row', 
-                             gridspec_kw=dict(hspace=0.05,wspace=0.05))
+    fig, axes = _subplots(fig, nrows=nb_features, ncols=nb_features, figsize=figsize,
+                          sharex='col', #sharey='row', 
+                          squeeze=False, gridspec_kw=dict(hspace=0.05,wspace=0.05))
     
     if (c is None):
         c = np.zeros(data.shape[0],dtype=int)
@@ -369,14 +523,26 @@ def scatter_matrix(data, c=None, labels=None, title=None, cmap='viridis', norm=N
     sm=cm.ScalarMappable(cmap=cmap,norm=norm)
     cols=sm.to_rgba(range(nb_classes))[:,:3]
     listedNorm=Normalize(vmin=-0.5, vmax=nb_classes-0.5)
+    if (density):
+        idx, vmins, vmaxs = _bin_indices(data, bins)
+        # Class-major bin index; feature f lands at offset f*nb_classes*bins
+        class_idx = c[:, None] * bins + idx
+        diag_counts = np.bincount(
+            (class_idx + np.arange(nb_features) * nb_classes * bins).ravel(),
+            minlength=nb_features * nb_classes * bins
+        ).reshape(nb_features, nb_classes, bins)
     for i in range(nb_features):
         for j in range(nb_features):
-            plt.sca(axes[i,j])
+            ax = axes[i,j]
             if (i==j):
                 vmin=np.min(data[:,i])
                 vmax=np.max(data[:,i])
                 for k in range(nb_classes):
-                    h, edges = np.histogram(data[c==k,i],range=(vmin,vmax))
+                    if (density):
+                        h = diag_counts[i,k]
+                        edges = np.linspace(vmin, vmax, bins+1)
+                    else:
+                        h, edges = np.histogram(data[c==k,i],range=(vmin,vmax))
                     #plt.fill_between((edges[:-1]+edges[1:])/2, h, color=cols[k,:], alpha=0.5)
                     xs = np.zeros(2*(edges.size-1))
                     ys = np.zeros(2*(edges.size-1))
@@ -384,40 +550,48 @@ def scatter_matrix(data, c=None, labels=None, title=None, cmap='viridis', norm=N
                     ys[::2]=h; ys[1::2]=h;
                     xs=np.insert(xs,0,xs[0]); xs=np.append(xs,xs[-1])
                     ys=np.insert(ys,0,0); ys=np.append(ys,0)
-                    plt.fill_between(xs, ys, color=cols[k,:], alpha=0.2)
-                    plt.plot(xs, ys, color=cols[k,:])
+                    ax.fill_between(xs, ys, color=cols[k,:], alpha=0.2)
+                    ax.plot(xs, ys, color=cols[k,:])
                     #plt.bar(edges[:-1], h, width=edges[1:]-edges[:-1], color=cols[k,:], alpha=0.5)
                     r=vmax-vmin
-                    plt.xlim(vmin-r/20,vmax+r/20)
+                    ax.set_xlim(vmin-r/20,vmax+r/20)
+            elif (density):
+                counts = np.bincount(class_idx[:,i] * bins + idx[:,j],
+                                     minlength=nb_classes * bins * bins)
+                counts = counts.reshape(nb_classes, bins, bins)
+                ax.imshow(_density_image(counts, cols), origin='lower',
+                          extent=(vmins[j], vmaxs[j], vmins[i], vmaxs[i]),
+                          aspect='auto', interpolation='nearest')
             else:
-                plt.scatter(data[:,j], data[:,i], c=c, axes=axes[i,j], 
-                            cmap=ListedColormap(cols), norm=listedNorm, marker='+')
+                ax.scatter(data[:,j], data[:,i], c=c, 
+                           cmap=ListedColormap(cols), norm=listedNorm, marker='+')
             #if (i<nb_features-1): plt.xticks([])
-            if (j>0 and j<nb_features-1): axes[i,j].tick_params(labelleft='off')   
-            if (i==j): plt.yticks([]) 
-            if (i==nb_features-1 and j==nb_features-1): axes[i,j].tick_params(labelleft='off')   
-            if (j==nb_features-1 and i<nb_features-1): axes[i,j].yaxis.tick_right()
-            if (i==0): axes[i,j].xaxis.tick_top()
+            if (j>0 and j<nb_features-1): ax.tick_params(labelleft=False)   
+            if (i==j): ax.set_yticks([]) 
+            if (i==nb_features-1 and j==nb_features-1): ax.tick_params(labelleft=False)   
+            if (j==nb_features-1 and i<nb_features-1): ax.yaxis.tick_right()
+            if (i==0): ax.xaxis.tick_top()
             if (i==nb_features-1): 
-                plt.xlabel(labels[j], fontsize=7);
+                ax.set_xlabel(labels[j], fontsize=7);
             if (j==0): 
-                plt.ylabel(labels[i], fontsize=7);
-            plt.tick_params(labelsize=6)
+                ax.set_ylabel(labels[i], fontsize=7);
+            ax.tick_params(labelsize=6)
             
     if title is not None:
-        plt.suptitle(title,y=0.99)
-        plt.subplots_adjust(left=0, bottom=0, right=1, top=0.90, wspace=0, hspace=0)
+        fig.suptitle(title,y=0.99)
+        fig.subplots_adjust(left=0, bottom=0, right=1, top=0.90, wspace=0, hspace=0)
     else:
-        plt.subplots_adjust(left=0, bottom=0, right=1, top=1, wspace=0, hspace=0)
+        fig.subplots_adjust(left=0, bottom=0, right=1, top=1, wspace=0, hspace=0)
         
     if (show_colorbar):
-        plt.subplots_adjust(right=0.95)
+        fig.subplots_adjust(right=0.95)
         cb=discrete_colorbar(cols, labels=class_labels, ax=axes.ravel().tolist())
         
     return fig
 
 
-def show_segmentation(im, segm, colors=None, labels=None, figsize=(12,2.5), show_contours=False, cmap=None):
+def show_segmentation(im, segm, colors=None, labels=None, figsize=(12,2.5), show_contours=False, cmap=None,
+                      fig=None):
     """
     Show image along with segmentation
     
@@ -432,8 +606,15 @@ def show_segmentation(im, segm, colors=None, labels=None, figsize=(12,2.5), show
     
     colors: list of colors 
         each color is given as a list of R,G,B float values
+
+    fig : Figure
+        figure to draw into instead of a new pyplot figure
+
+    Returns
+    -------
+    axes : array of the 3 image Axes
     """
-    fig, axes = plt.subplots(1,3,figsize=figsize)
+    fig, axes = _subplots(fig, ncols=3, figsize=figsize)
     
     if colors is None:
         cbcmap=get_cmap('jet')
@@ -442,36 +623,54 @@ def show_segmentation(im, segm, colors=None, labels=None, figsize=(12,2.5), show
         colors = cbcmap(colors_i)
         colors[0,:]=[0,0,0, 1.]
 
-    plt.sca(axes[0])
     if (show_contours):
-        from skimage import segmentation
-        #plt.imshow(segmentation.mark_boundaries(im, segm),interpolation='bilinear')
-        plt.imshow(im)
-        for i,c in enumerate(colors[1:]):
-            plt.contour(filters.gaussian(segm==(i+1),1), colors=[c], levels=[0.95])
+        # Boundaries of all labels in one pass, drawn as a single RGBA layer
+        axes[0].imshow(im)
+        axes[0].imshow(boundary_overlay(segm, colors), interpolation='nearest')
     else:
-        plt.imshow(im, cmap=cmap)
-    plt.title('Input image')
+        axes[0].imshow(im, cmap=cmap)
+    axes[0].set_title('Input image')
 
-    plt.sca(axes[2])
     #rgb = color.label2rgb(segm, None, colors=colors)
     # Had to replace label2rgb by direct mapping due to change in behavior
-    # in skimage
-    colp = color.label2rgb(np.array(range(segm.max()+1)), None, colors=colors)
-    rgb = colp[segm]
-    plt.imshow(rgb, cmap=ListedColormap(colors))
-    plt.title('Segmentation')
+    # in skimage. The uint8 palette keeps the label image and the overlay
+    # at one byte per channel.
+    palette = label_palette(colors, segm.max()+1)
+    axes[2].imshow(palette[segm], cmap=ListedColormap(colors))
+    axes[2].set_title('Segmentation')
     
-    plt.sca(axes[1])
-    plt.imshow((np.atleast_3d(img_as_float(im))+rgb)/2)
-    plt.title('Overlay')
+    axes[1].imshow(composite_labels(im, segm, palette))
+    axes[1].set_title('Overlay')
     
     cb=discrete_colorbar(colors, labels, ax=axes.ravel().tolist())
 
-    import skdemo
-    skdemo.match_axes_height(axes[2], cb.ax)
+    match_axes_height(axes[2], cb.ax)
+    return axes
 
-def show_features(features, labels=None, nx='auto', axsize=(4/3,1.1), cmap='gray'):
+def _feature_mosaic(features, nx, ny, pad=2, downsample=1):
+    """ Tile a (rows, cols, n) feature stack into one 2D canvas.
+
+    Every map is rescaled to [0, 1] on its own, as `imshow` would, and the
+    padding between tiles is NaN so it shows as background.
+    """
+    if (downsample > 1):
+        features = _preview.area_downsample(features, downsample)
+    features = np.asarray(features, dtype=np.float32)
+    h, w, nb_features = features.shape
+    vmin = features.min(axis=(0, 1))
+    span = features.max(axis=(0, 1)) - vmin
+    span[span == 0] = 1
+    tiles = np.full((ny * nx, h, w), np.nan, dtype=np.float32)
+    tiles[:nb_features] = np.moveaxis((features - vmin) / span, -1, 0)
+
+    canvas = np.full((ny, h + pad, nx, w + pad), np.nan, dtype=np.float32)
+    canvas[:, :h, :, :w] = tiles.reshape(ny, nx, h, w).transpose(0, 2, 1, 3)
+    canvas = canvas.reshape(ny * (h + pad), nx * (w + pad))
+    return canvas[:canvas.shape[0] - pad, :canvas.shape[1] - pad]
+
+
+def show_features(features, labels=None, nx='auto', axsize=(4/3,1.1), cmap='gray',
+                  mosaic=False, pad=2, downsample=1, fig=None):
     """
     Parameters
     ----------
@@ -484,22 +683,49 @@ def show_features(features, labels=None, nx='auto', axsize=(4/3,1.1), cmap='gray
     
     axsize: (sx,sy) 
         size of each image axes
+
+    mosaic : bool
+        If True, pack all normalized feature maps into a single canvas
+        drawn with one `imshow` instead of one axes per feature. This keeps
+        layout time flat for large stacks (e.g. Gabor banks).
+
+    pad : int
+        Pixels between tiles in mosaic mode
+
+    downsample : int
+        Area-averaging factor applied to the maps in mosaic mode
+
+    fig : Figure
+        figure to draw into instead of a new pyplot figure
     """
     features = np.atleast_3d(features)
     nb_features = features.shape[2]
     if (nx=='auto'):
         nx=min(nb_features,8)
     ny=(nb_features+nx-1)//nx # Ceil nb_features/nx
-    fig, axes = plt.subplots(ny,nx, squeeze=False, figsize=(axsize[0]*nx,axsize[1]*ny))
+    if (labels is None):
+        labels=['Feature {}'.format(i) for i in range(nb_features)]
+    if (mosaic):
+        fig, ax = _subplots(fig, figsize=(axsize[0]*nx,axsize[1]*ny))
+        ax.axis('off')
+        canvas = _feature_mosaic(features, nx, ny, pad=pad, downsample=downsample)
+        ax.imshow(canvas, cmap=cmap, vmin=0, vmax=1, interpolation='nearest')
+        tile_h = (canvas.shape[0] + pad) // ny
+        tile_w = (canvas.shape[1] + pad) // nx
+        for i in range(nb_features):
+            ax.text((i % nx) * tile_w, (i // nx) * tile_h, labels[i],
+                    fontsize=6, color='w', va='top', ha='left',
+                    bbox=dict(facecolor='k', alpha=0.5, pad=1, linewidth=0))
+        fig.subplots_adjust(left=0, right=1, bottom=0, top=1)
+        return fig
+    fig, axes = _subplots(fig, nrows=ny, ncols=nx, squeeze=False,
+                          figsize=(axsize[0]*nx,axsize[1]*ny))
     for ax in fig.axes: ax.axis('off')
     for i in range(nb_features):
-        plt.sca(axes.ravel()[i])
-        plt.imshow(features[:,:,i], cmap=cmap)
+        ax = axes.ravel()[i]
+        ax.imshow(features[:,:,i], cmap=cmap)
         #plt.axis('off')
-        if (labels is None):
-            plt.title('Feature {}'.format(i), fontsize=6)
-        else:
-            plt.title(labels[i], fontsize=6)
+        ax.set_title(labels[i], fontsize=6)
     return fig
 
 def force_integer_ticks(axes):
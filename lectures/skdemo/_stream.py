@@ -0,0 +1,554 @@
+"""Stream frame sequences through a pipeline of stages.
+
+The lecture pipelines work on one image; `FramePipeline` applies the same
+chain of operations to a long sequence of frames (numbered image files, a
+``.npy`` stack or any iterable of arrays) with every stage running
+concurrently::
+
+    pipeline = FramePipeline('frames/*.png', [
+        Stage(color.rgb2gray),
+        Stage(ndi.gaussian_filter, kwargs={'sigma': 2}, out='output'),
+        Stage(feature.canny, kind='process', workers=4),
+    ])
+    for edges in pipeline:
+        ...
+    print(pipeline.report())
+
+Each stage runs on its own thread, and consecutive stages are connected by
+bounded queues: a stage blocks when the next one falls behind, so the
+pipeline settles at the rate of its slowest stage with a bounded number of
+frames in memory. A stage can also spread its frames over a pool of
+threads or processes (``workers``); frames are then sent to worker
+processes through shared memory rather than pickled.
+
+Output buffers are allocated once per stage, after the first frame, and
+recycled: a stage whose function can write into an output argument (the
+`out` keyword) does not allocate arrays per frame. Frames handed over by a
+stage are therefore only valid until the next stage is done with them;
+copy the frames you want to keep.
+"""
+from __future__ import division
+
+import os
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from ._shared import SharedArray, call_with_arrays
+
+
+__all__ = ['FramePipeline', 'Stage', 'StageStats', 'iter_frames']
+
+
+# Seconds between checks of the stop flag while blocked on a queue
+_POLL = 0.05
+
+
+def iter_frames(source):
+    """ Iterate over the frames of a sequence.
+
+    Parameters
+    ----------
+    source : str, list of str, ndarray or iterable
+        A ``.npy`` file, whose first axis indexes the frames (it is memory
+        mapped, so frames are read on demand); a glob pattern (or a list of
+        patterns) of image files, read in sorted order by a
+        `PrefetchCollection`; an array of frames; or an iterable of frames.
+    """
+    if isinstance(source, str) and source.endswith('.npy') and \
+            os.path.isfile(source):
+        source = np.load(source, mmap_mode='r')
+    if isinstance(source, np.ndarray):
+        for frame in source:
+            yield frame
+    elif isinstance(source, str) or (isinstance(source, (list, tuple)) and
+                                     source and isinstance(source[0], str)):
+        from ._collection import PrefetchCollection
+
+        with PrefetchCollection(list(np.atleast_1d(source))) as frames:
+            if not len(frames):
+                raise ValueError('No file matches {!r}'.format(source))
+            for frame in frames:
+                yield frame
+    else:
+        for frame in source:
+            yield frame
+
+
+class Stage(object):
+    """ Operation applied to every frame of a `FramePipeline`.
+
+    Parameters
+    ----------
+    func : callable
+        ``func(frame, **kwargs)`` returns the processed frame. With
+        ``generator=True``, ``func(frames, **kwargs)`` is a generator
+        function instead, consuming an iterator of frames and yielding
+        output frames, e.g. for stages keeping state between frames.
+    kwargs : dict
+        Keyword-arguments of `func`.
+    out : str
+        Name of the keyword-argument through which `func` writes its result
+        into an existing array (e.g. 'output' for `scipy.ndimage` filters,
+        'out' for NumPy ufuncs). Results are then written into recycled
+        buffers instead of newly allocated arrays.
+    kind : {'thread', 'process'}
+        Run `func` on threads or in worker processes. Process stages need a
+        picklable `func` (a module-level function) and frames of constant
+        shape and dtype.
+    workers : int
+        Number of frames processed at a time; frames are still passed on
+        in order.
+    name : str
+        Name of the stage in the statistics, by default the name of `func`.
+    """
+
+    def __init__(self, func, kwargs=None, out=None, kind='thread',
+                 workers=1, generator=False, name=None):
+        if kind not in ('thread', 'process'):
+            raise ValueError('Unknown stage kind: {!r}'.format(kind))
+        if generator and (kind != 'thread' or workers != 1):
+            raise ValueError('Generator stages run on a single thread')
+        if workers < 1:
+            raise ValueError('workers must be at least 1, got {}'
+                             .format(workers))
+        self.func = func
+        self.kwargs = kwargs or {}
+        self.out = out
+        self.kind = kind
+        self.workers = workers
+        self.generator = generator
+        self.name = name or getattr(func, '__name__', type(func).__name__)
+
+    def __repr__(self):
+        return 'Stage({}, kind={!r}, workers={})'.format(self.name, self.kind,
+                                                         self.workers)
+
+
+class StageStats(namedtuple('StageStats',
+                            ['name', 'frames', 'elapsed', 'busy', 'starved',
+                             'blocked'])):
+    """ Throughput counters of a pipeline stage.
+
+    `elapsed` is the wall time since the pipeline started, `busy` the time
+    spent in the stage function (summed over workers), `starved` the time
+    spent waiting for input frames and `blocked` the time spent waiting for
+    the next stage to accept a frame or to return a buffer, all in seconds.
+    """
+    __slots__ = ()
+
+    @property
+    def fps(self):
+        """Sustained throughput, in frames per second."""
+        return self.frames / self.elapsed if self.elapsed else 0.
+
+
+class _Stopped(Exception):
+    """The pipeline is being closed."""
+
+
+class _Failure(object):
+    """Exception raised by a stage, passed on to the consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+_END = object()
+
+
+class _BufferPool(object):
+    """ Fixed set of arrays shaped like `template`, handed out and returned.
+
+    Shared buffers are `SharedArray` blocks, whose descriptors are sent to
+    worker processes.
+    """
+
+    def __init__(self, template, size, shared=False):
+        self.shape = template.shape
+        self.dtype = template.dtype
+        self.blocks = []
+        self._free = queue.Queue()
+        for _ in range(size):
+            if shared:
+                block = SharedArray(template.shape, template.dtype)
+                self.blocks.append(block)
+                self._free.put((block.array, block.descriptor()))
+            else:
+                self._free.put((np.empty_like(template), None))
+
+    def acquire(self, stop):
+        while True:
+            try:
+                return self._free.get(timeout=_POLL)
+            except queue.Empty:
+                if stop.is_set():
+                    raise _Stopped()
+
+    def releaser(self, buf):
+        return lambda: self._free.put(buf)
+
+    def check(self, frame):
+        if frame.shape != self.shape or frame.dtype != self.dtype:
+            raise ValueError('Frames of a process stage must all have the '
+                             'same shape and dtype: expected {} {}, got {} {}'
+                             .format(self.shape, self.dtype, frame.shape,
+                                     frame.dtype))
+
+    def release_blocks(self):
+        for block in self.blocks:
+            block.release()
+
+
+def _apply(func, frame, dst, kwargs, out):
+    """Run `func` on one frame, into `dst` if given; also return the time."""
+    start = time.perf_counter()
+    if dst is None:
+        result = func(frame, **kwargs)
+    elif out is not None:
+        kwargs = dict(kwargs)
+        kwargs[out] = dst
+        func(frame, **kwargs)
+        result = None
+    else:
+        dst[...] = func(frame, **kwargs)
+        result = None
+    return result, time.perf_counter() - start
+
+
+class _Runner(object):
+    """Thread running one stage between its input and output queues."""
+
+    def __init__(self, stage, inbox, outbox, stop, pool_size):
+        self.stage = stage
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop = stop
+        self.pool_size = pool_size
+        self.frames = 0
+        self.busy = 0.
+        self.starved = 0.
+        self.blocked = 0.
+        self.start = self.end = None
+        self.pools = []
+        self.executor = None
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name='stage-' + stage.name)
+
+    def stats(self):
+        end = self.end or time.perf_counter()
+        elapsed = end - self.start if self.start is not None else 0.
+        return StageStats(self.stage.name, self.frames, elapsed, self.busy,
+                          self.starved, self.blocked)
+
+    def run(self):
+        try:
+            if self.stage.generator:
+                self._run_generator()
+            else:
+                self._run_map()
+            self._put(_END)
+        except _Stopped:
+            pass
+        except BaseException as error:
+            try:
+                self._put(_Failure(error))
+            except _Stopped:
+                pass
+        finally:
+            self.end = time.perf_counter()
+            if self.executor is not None:
+                self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _get(self):
+        start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    return self.inbox.get(timeout=_POLL)
+                except queue.Empty:
+                    if self.stop.is_set():
+                        raise _Stopped()
+        finally:
+            self.starved += time.perf_counter() - start
+
+    def _put(self, item):
+        start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    return self.outbox.put(item, timeout=_POLL)
+                except queue.Full:
+                    if self.stop.is_set():
+                        raise _Stopped()
+        finally:
+            self.blocked += time.perf_counter() - start
+
+    def _acquire(self, pool):
+        start = time.perf_counter()
+        try:
+            return pool.acquire(self.stop)
+        finally:
+            self.blocked += time.perf_counter() - start
+
+    def _inputs(self):
+        """(frame, release) pairs from the previous stage."""
+        while True:
+            item = self._get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                self._put(item)
+                raise _Stopped()
+            yield item
+
+    def _emit(self, frame, release):
+        self.frames += 1
+        self._put((frame, release))
+
+    def _run_generator(self):
+        held = [None]
+
+        def frames():
+            for frame, release in self._inputs():
+                # The generator asks for a frame once done with the last one
+                if held[0] is not None:
+                    held[0]()
+                held[0] = release
+                yield frame
+
+        outputs = self.stage.func(frames(), **self.stage.kwargs)
+        self.start = time.perf_counter()
+        try:
+            while True:
+                waited = self.starved + self.blocked
+                start = time.perf_counter()
+                try:
+                    frame = next(outputs)
+                except StopIteration:
+                    break
+                finally:
+                    self.busy += (time.perf_counter() - start -
+                                  (self.starved + self.blocked - waited))
+                self._emit(frame, None)
+        finally:
+            outputs.close()
+            if held[0] is not None:
+                held[0]()
+
+    def _run_map(self):
+        stage = self.stage
+        process = stage.kind == 'process'
+        pooled = process or stage.out is not None
+        inputs = self._inputs()
+        self.start = time.perf_counter()
+
+        # The first frame gives the shape and dtype of the buffers
+        for frame, release in inputs:
+            result, seconds = _apply(stage.func, frame, None, stage.kwargs,
+                                     None)
+            self.busy += seconds
+            if pooled:
+                result = np.asarray(result)
+                out_pool = _BufferPool(result, self.pool_size, process)
+                self.pools.append(out_pool)
+                buf = self._acquire(out_pool)
+                buf[0][...] = result
+                result, done = buf[0], out_pool.releaser(buf)
+            else:
+                done = None
+            if process:
+                in_pool = _BufferPool(np.asarray(frame), stage.workers + 1,
+                                      shared=True)
+                self.pools.append(in_pool)
+            if release is not None:
+                release()
+            self._emit(result, done)
+            break
+        else:
+            return
+
+        if stage.kind == 'thread' and stage.workers == 1:
+            for frame, release in inputs:
+                buf = self._acquire(out_pool) if pooled else (None, None)
+                result, seconds = _apply(stage.func, frame, buf[0],
+                                         stage.kwargs, stage.out)
+                self.busy += seconds
+                if release is not None:
+                    release()
+                if pooled:
+                    self._emit(buf[0], out_pool.releaser(buf))
+                else:
+                    self._emit(result, None)
+            return
+
+        if process:
+            self.executor = ProcessPoolExecutor(stage.workers)
+        else:
+            self.executor = ThreadPoolExecutor(stage.workers)
+        pending = deque()
+        for frame, release in inputs:
+            buf = self._acquire(out_pool) if pooled else (None, None)
+            if process:
+                frame = np.asarray(frame)
+                in_pool.check(frame)
+                slot = self._acquire(in_pool)
+                slot[0][...] = frame
+                if release is not None:
+                    release()
+                release = in_pool.releaser(slot)
+                future = self.executor.submit(
+                    call_with_arrays, _apply, stage.func, slot[1], buf[1],
+                    stage.kwargs, stage.out)
+            else:
+                future = self.executor.submit(_apply, stage.func, frame,
+                                              buf[0], stage.kwargs, stage.out)
+            pending.append((future, release, buf))
+            while len(pending) >= stage.workers:
+                self._finish(pending.popleft(), out_pool if pooled else None)
+        while pending:
+            self._finish(pending.popleft(), out_pool if pooled else None)
+
+    def _finish(self, task, out_pool):
+        future, release, buf = task
+        result, seconds = future.result()
+        self.busy += seconds
+        if release is not None:
+            release()
+        if out_pool is not None:
+            self._emit(buf[0], out_pool.releaser(buf))
+        else:
+            self._emit(result, None)
+
+
+class FramePipeline(object):
+    """ Stages applied to a stream of frames, all running concurrently.
+
+    Iterating over the pipeline starts it and yields the frames output by
+    the last stage, in order. A yielded frame may be a recycled buffer: it
+    is valid until the next frame is requested. An exception raised by a
+    stage stops the pipeline and is raised by the iteration.
+
+    Parameters
+    ----------
+    source : str, list of str, ndarray or iterable
+        Frames to process, see `iter_frames`. The source is read on its own
+        thread.
+    stages : list of `Stage` or callable
+        Operations applied in turn; plain callables run as
+        ``Stage(func)``.
+    queue_size : int
+        Number of frames waiting between two stages. A stage blocks while
+        the queue to the next stage is full.
+
+    Examples
+    --------
+    >>> pipeline = FramePipeline('stack.npy', [             # doctest: +SKIP
+    ...     Stage(ndi.gaussian_filter, kwargs={'sigma': 2}, out='output'),
+    ...     Stage(feature.canny, kind='process', workers=4)])
+    >>> n_edges = [edges.sum() for edges in pipeline]       # doctest: +SKIP
+    >>> pipeline.stats()[-1].fps                            # doctest: +SKIP
+    57.3
+    """
+
+    def __init__(self, source, stages, queue_size=4):
+        if queue_size < 1:
+            raise ValueError('queue_size must be at least 1, got {}'
+                             .format(queue_size))
+        self.source = source
+        self.stages = [stage if isinstance(stage, Stage) else Stage(stage)
+                       for stage in stages]
+        self.queue_size = queue_size
+        self._stop = threading.Event()
+        self._runners = []
+        self._outbox = None
+
+    def _start(self):
+        if self._runners:
+            raise RuntimeError('A FramePipeline can only be run once')
+        source = Stage(lambda frames: iter_frames(self.source),
+                       generator=True, name='source')
+        stages = [source] + self.stages
+        inbox = queue.Queue()
+        inbox.put(_END)
+        for n, stage in enumerate(stages):
+            outbox = queue.Queue(maxsize=self.queue_size)
+            # Buffers are held by this stage's workers, the queue and the
+            # workers of the next stage (or the consumer)
+            holders = stages[n + 1].workers if n + 1 < len(stages) else 1
+            pool_size = stage.workers + self.queue_size + holders + 1
+            self._runners.append(_Runner(stage, inbox, outbox, self._stop,
+                                         pool_size))
+            inbox = outbox
+        self._outbox = inbox
+        for runner in self._runners:
+            runner.thread.start()
+
+    def __iter__(self):
+        self._start()
+        release = None
+        try:
+            while True:
+                if release is not None:
+                    release()
+                    release = None
+                item = self._outbox.get()
+                if item is _END:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                frame, release = item
+                yield frame
+        finally:
+            if release is not None:
+                release()
+            self.close()
+
+    def run(self, sink=None):
+        """ Process the whole stream.
+
+        `sink`, if given, is called with every output frame. Returns the
+        statistics of the stages, see `stats`.
+        """
+        for frame in self:
+            if sink is not None:
+                sink(frame)
+        return self.stats()
+
+    def stats(self):
+        """`StageStats` of the source and of every stage, in order."""
+        return [runner.stats() for runner in self._runners]
+
+    def report(self):
+        """Text table of the stage statistics."""
+        header = '{:<24} {:>8} {:>9} {:>10} {:>12} {:>12}'.format(
+            'stage', 'frames', 'fps', 'busy [s]', 'starved [s]',
+            'blocked [s]')
+        lines = [header, '-' * len(header)]
+        for s in self.stats():
+            lines.append('{:<24} {:>8} {:>9.1f} {:>10.3f} {:>12.3f} '
+                         '{:>12.3f}'.format(s.name, s.frames, s.fps, s.busy,
+                                            s.starved, s.blocked))
+        return '\n'.join(lines)
+
+    def close(self):
+        """Stop all stages and free their buffers."""
+        self._stop.set()
+        for runner in self._runners:
+            runner.thread.join()
+        # Shared buffers go once no stage can be using them any more
+        for runner in self._runners:
+            for pool in runner.pools:
+                pool.release_blocks()
+            runner.pools = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
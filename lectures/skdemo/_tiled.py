@@ -0,0 +1,191 @@
+"""Run local image operators tile by tile, for images larger than memory."""
+from __future__ import division
+
+import itertools
+import mmap
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ._shared import SharedArray, call_with_arrays
+
+
+__all__ = ['tiled_apply', 'footprint_halo', 'sigma_halo']
+
+
+def footprint_halo(footprint):
+    """Halo needed by an operator with the given footprint (array or shape)."""
+    shape = footprint if isinstance(footprint, tuple) else np.shape(footprint)
+    return tuple(int(n) // 2 for n in shape)
+
+
+def sigma_halo(sigma, truncate=4.0):
+    """Halo of a Gaussian filter, with the kernel radius of `scipy.ndimage`."""
+    return tuple(int(truncate * float(s) + 0.5)
+                 for s in np.atleast_1d(sigma))
+
+
+# Worker-side reference to an array in a memory-mapped file
+_MappedFile = namedtuple('_MappedFile', ['filename', 'file_offset', 'length',
+                                         'offset', 'shape', 'dtype',
+                                         'strides'])
+
+
+def _mapped_file(array):
+    """`_MappedFile` of an array viewing a file-backed `np.memmap`."""
+    root = array
+    while isinstance(root, np.ndarray) and not isinstance(root.base,
+                                                          mmap.mmap):
+        root = root.base
+    if not isinstance(root, np.memmap) or not getattr(root, 'filename',
+                                                      None):
+        return None
+    address = array.__array_interface__['data'][0]
+    root_address = root.__array_interface__['data'][0]
+    return _MappedFile(root.filename, root.offset, root.nbytes,
+                       address - root_address, array.shape, array.dtype.str,
+                       array.strides)
+
+
+def _open_mapped(desc, mode):
+    data = np.memmap(desc.filename, dtype=np.uint8, mode=mode,
+                     offset=desc.file_offset, shape=(desc.length,))
+    return np.ndarray(desc.shape, dtype=np.dtype(desc.dtype), buffer=data,
+                      offset=desc.offset, strides=desc.strides)
+
+
+def _tiles(shape, tile_shape, halo):
+    """(read, inner, write) slices of every tile of an image of `shape`."""
+    ranges = []
+    for n, t, h in zip(shape, tile_shape, halo):
+        axis = []
+        for start in range(0, n, t):
+            stop = min(start + t, n)
+            r0, r1 = max(0, start - h), min(n, stop + h)
+            axis.append((slice(r0, r1), slice(start - r0, stop - r0),
+                         slice(start, stop)))
+        ranges.append(axis)
+    for combination in itertools.product(*ranges):
+        read, inner, write = zip(*combination)
+        yield read, inner, write
+
+
+def _run_tile(func, src, dst, read, inner, write, kwargs):
+    if isinstance(src, _MappedFile):
+        src = _open_mapped(src, 'r')
+    if isinstance(dst, _MappedFile):
+        dst = _open_mapped(dst, 'r+')
+    result = np.asarray(func(np.array(src[read]), **kwargs))
+    dst[write] = result[inner]
+
+
+def tiled_apply(func, image, halo=None, footprint=None, sigma=None,
+                truncate=4.0, tile_shape=(2048, 2048), kwargs=None, out=None,
+                filename=None, processes=None):
+    """ Apply a local operator to `image` tile by tile, in a process pool.
+
+    Each tile is read with a halo of neighbouring pixels, `func` is applied
+    to it, and only the interior of the result, which does not depend on
+    pixels outside the halo, is written to the output. For operators
+    reaching at most `halo` pixels away (filters, morphology, ...), the
+    result equals ``func(image)``. Operators with global effects (e.g.
+    labelling or superpixels) are not local and give per-tile results.
+
+    A memory-mapped input is mapped again by the workers, so no tile is
+    pickled; other inputs are copied once to shared memory. Results are
+    written by the workers straight into the output, by default a
+    memory-mapped ``.npy`` file.
+
+    Parameters
+    ----------
+    func : callable
+        ``func(tile, **kwargs)`` returns an array of the spatial shape of
+        `tile` (trailing axes may differ, e.g. for features). It must be
+        picklable, e.g. a module-level function.
+    image : ndarray or np.memmap
+        Image, tiled along its first ``len(tile_shape)`` axes.
+    halo : int or tuple of int
+        Pixels of context on each side of a tile. Derived from `footprint`
+        (half its size) or `sigma` (the Gaussian kernel radius at
+        `truncate` standard deviations) when not given.
+    tile_shape : tuple of int
+        Size of the tiles, without halo.
+    kwargs : dict
+        Keyword-arguments of `func`.
+    out : ndarray
+        Output array; by default a memory-mapped ``.npy`` file is created at
+        `filename` (a temporary file if None, which the caller deletes).
+    processes : int or None
+        Number of worker processes, by default the number of CPUs; 0 runs
+        all tiles in this process.
+
+    Returns
+    -------
+    out : ndarray or np.memmap
+
+    Examples
+    --------
+    >>> from skimage.morphology import rectangle            # doctest: +SKIP
+    >>> median = tiled_apply(filters.median, scan, footprint=(5, 5),
+    ...                      kwargs={'footprint': rectangle(5, 5)})
+    """
+    kwargs = kwargs or {}
+    ndim = len(tile_shape)
+    if halo is None:
+        if footprint is not None:
+            halo = footprint_halo(footprint)
+        elif sigma is not None:
+            halo = sigma_halo(sigma, truncate)
+        else:
+            halo = 0
+    halo = tuple(np.broadcast_to(halo, (ndim,)))
+    tiles = list(_tiles(image.shape[:ndim], tile_shape, halo))
+
+    # The first tile gives the output dtype and trailing shape
+    first_read, first_inner, first_write = tiles[0]
+    first = np.asarray(func(np.array(image[first_read]), **kwargs))
+    if out is None:
+        if filename is None:
+            with tempfile.NamedTemporaryFile(suffix='.npy',
+                                             delete=False) as f:
+                filename = f.name
+        out = np.lib.format.open_memmap(
+            filename, mode='w+', dtype=first.dtype,
+            shape=image.shape[:ndim] + first.shape[ndim:])
+    out[first_write] = first[first_inner]
+    if len(tiles) == 1:
+        return out
+
+    if processes == 0:
+        for read, inner, write in tiles[1:]:
+            _run_tile(func, image, out, read, inner, write, kwargs)
+        return out
+
+    shared = []
+    try:
+        src = _mapped_file(image)
+        if src is None:
+            shared.append(SharedArray.from_array(image))
+            src = shared[-1].descriptor()
+        dst = _mapped_file(out)
+        if dst is None:
+            shared.append(SharedArray(out.shape, out.dtype))
+            shared[-1].array[first_write] = first[first_inner]
+            dst = shared[-1].descriptor()
+        with ProcessPoolExecutor(processes) as pool:
+            futures = [pool.submit(call_with_arrays, _run_tile, func, src,
+                                   dst, read, inner, write, kwargs)
+                       for read, inner, write in tiles[1:]]
+            for future in futures:
+                future.result()
+        if isinstance(dst, _MappedFile):
+            if isinstance(out, np.memmap):
+                out.flush()
+        else:
+            out[...] = shared[-1].array
+    finally:
+        for block in shared:
+            block.release()
+    return out
@@ -0,0 +1,12 @@
+"""Helpers that only depend on NumPy."""
+import numpy as np
+
+
+__all__ = ['iter_channels']
+
+
+def iter_channels(color_image):
+    """Yield color channels of an image."""
+    # Roll array-axis so that we iterate over the color channels of an image.
+    for channel in np.rollaxis(color_image, -1):
+        yield channel
@@ -0,0 +1,167 @@
+"""Multi-panel views that update their artists instead of redrawing."""
+from __future__ import division
+
+import matplotlib
+from matplotlib.patches import Rectangle
+
+
+__all__ = ['ImshowParamsView']
+
+
+class ImshowParamsView(object):
+    """ Colormap / interpolation explorer for an image and an NxN block.
+
+    The four panels of the `imshow_params` lecture demo (original with the
+    block outline, raw block, image and block with the chosen colormap and
+    interpolation) are created once. `update` then only touches what
+    changed: `set_cmap` / `set_interpolation` on the two styled images, or
+    `set_data` on the block views plus the outline position. Moving the
+    block is blitted when the canvas supports it.
+
+    Parameters
+    ----------
+    image : ndarray
+        Image to explore.
+    block : int
+        Size N of the NxN block.
+    fig : `Figure`
+        Figure to draw into; by default a new pyplot figure.
+    """
+
+    def __init__(self, image, cmap='gray', interpolation='bicubic', x0=0,
+                 y0=0, block=16, fig=None):
+        from ._skdemo import _subplots
+
+        self.image = image
+        self.block = N = block
+        self.cmap, self.interpolation = cmap, interpolation
+        self.x0, self.y0 = x0, y0
+        self.fig, axes = _subplots(fig, ncols=4, figsize=(15, 4))
+        self.axes = axes
+        crop = self._crop()
+
+        axes[0].imshow(image, cmap='gray', interpolation='nearest')
+        self._outline = Rectangle((x0 - 0.5, y0 - 0.5), N, N, fill=False,
+                                  edgecolor='r', animated=True)
+        axes[0].add_patch(self._outline)
+        axes[0].set_title('Original')
+
+        self._raw_block = axes[1].imshow(crop, cmap='gray',
+                                         interpolation='nearest',
+                                         animated=True)
+        axes[1].set_title('{N}x{N} block'.format(N=N))
+        axes[1].set_xlabel('No interpolation')
+
+        self._styled = axes[2].imshow(image, cmap=cmap,
+                                      interpolation=interpolation)
+        self._styled_block = axes[3].imshow(crop, cmap=cmap,
+                                            interpolation=interpolation,
+                                            animated=True)
+        axes[3].set_title('{N}x{N} block'.format(N=N))
+        self._set_labels()
+        for ax in axes:
+            ax.set_xticks([])
+            ax.set_yticks([])
+
+        # Artists redrawn on their own when only the block moves
+        self._animated = [self._outline, self._raw_block, self._styled_block]
+        self._background = None
+        canvas = self.fig.canvas
+        self._blit = (getattr(canvas, 'supports_blit', False)
+                      and 'inline' not in matplotlib.get_backend())
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _crop(self):
+        N = self.block
+        return self.image[self.y0:self.y0+N, self.x0:self.x0+N]
+
+    def _set_labels(self):
+        self.axes[2].set_title('%s colormap' % self.cmap)
+        self.axes[2].set_xlabel('%s interpolation' % self.interpolation)
+        self.axes[3].set_xlabel('%s interpolation' % self.interpolation)
+
+    def _on_draw(self, event):
+        # Animated artists are skipped by a full draw: save the background
+        # for blitting, then draw them on top.
+        canvas = self.fig.canvas
+        if self._blit:
+            self._background = canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self._animated:
+            self.fig.draw_artist(artist)
+
+    def update(self, cmap=None, interpolation=None, x0=None, y0=None):
+        """ Apply the changed parameters to the existing artists.
+
+        Returns
+        -------
+        redrawn : str
+            'full' if the figure was redrawn, 'blit' if only the block
+            artists were, and 'none' if nothing changed.
+        """
+        restyle = False
+        if cmap is not None and cmap != self.cmap:
+            self.cmap = cmap
+            self._styled.set_cmap(cmap)
+            self._styled_block.set_cmap(cmap)
+            restyle = True
+        if interpolation is not None and interpolation != self.interpolation:
+            self.interpolation = interpolation
+            self._styled.set_interpolation(interpolation)
+            self._styled_block.set_interpolation(interpolation)
+            restyle = True
+        moved = False
+        if (x0 is not None and x0 != self.x0) or \
+                (y0 is not None and y0 != self.y0):
+            self.x0 = self.x0 if x0 is None else x0
+            self.y0 = self.y0 if y0 is None else y0
+            crop = self._crop()
+            for block in (self._raw_block, self._styled_block):
+                # Each block gets its own intensity range, as with `imshow`
+                block.set_data(crop)
+                block.autoscale()
+            self._outline.set_xy((self.x0 - 0.5, self.y0 - 0.5))
+            moved = True
+
+        canvas = self.fig.canvas
+        if restyle:
+            self._set_labels()
+            canvas.draw_idle()
+            return 'full'
+        if moved:
+            if self._blit and self._background is not None:
+                canvas.restore_region(self._background)
+                for artist in self._animated:
+                    self.fig.draw_artist(artist)
+                canvas.blit(self.fig.bbox)
+                canvas.flush_events()
+                return 'blit'
+            canvas.draw_idle()
+            return 'full'
+        return 'none'
+
+    def interact(self, **widget_kwargs):
+        """ Drive `update` from widgets, as `ipywidgets.interact` would.
+
+        With the inline backend, the figure is shown again in an output
+        widget after each change.
+        """
+        import ipywidgets
+        from IPython.display import display
+
+        output = None
+        if 'inline' in matplotlib.get_backend():
+            import matplotlib.pyplot as plt
+            plt.close(self.fig)
+            output = ipywidgets.Output()
+
+        def update(**params):
+            self.update(**params)
+            if output is not None:
+                output.clear_output(wait=True)
+                output.append_display_data(self.fig)
+
+        controls = ipywidgets.interactive(update, **widget_kwargs)
+        display(controls)
+        if output is not None:
+            display(output)
+        return controls
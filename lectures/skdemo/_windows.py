@@ -0,0 +1,120 @@
+"""Sliding-window views of images built on stride tricks."""
+from __future__ import division
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+__all__ = ['iter_windows', 'window_view']
+
+
+def iter_windows(image, size=1):
+    """ Yield position, window slices and neighbourhood for each pixel.
+
+    The neighbourhood is a zero-copy view of `image` spanning `size` pixels
+    on each side of the center, clipped at the image borders.
+
+    Yields
+    ------
+    (i, j) : tuple of int
+        Row and column of the center pixel.
+    slices : tuple of slice
+        Bounds of the window in `image`.
+    subimage : ndarray
+        View of `image[slices]`.
+    """
+    height, width = image.shape[:2]
+    row_slices = [slice(max(i - size, 0), min(i + size + 1, height))
+                  for i in range(height)]
+    col_slices = [slice(max(j - size, 0), min(j + size + 1, width))
+                  for j in range(width)]
+    for i, rows in enumerate(row_slices):
+        for j, cols in enumerate(col_slices):
+            yield (i, j), (rows, cols), image[rows, cols]
+
+
+def window_view(image, size=1, mode='valid', **pad_kwargs):
+    """ Return all (2*size+1) x (2*size+1) windows of `image` as one array.
+
+    The result has shape (rows, cols, 2*size+1, 2*size+1) + channels and
+    shares memory with `image` (or with its padded copy), so reductions
+    such as ``window_view(image).mean(axis=(2, 3))`` are fully vectorized.
+    The view is read-only.
+
+    Parameters
+    ----------
+    mode : str
+        'valid' only returns windows that fit inside the image, so the
+        result has `2*size` fewer rows and columns. Any other value is used
+        as the `np.pad` mode to pad the image first and get one window per
+        pixel.
+    pad_kwargs : dict
+        Additional keyword-arguments passed to `np.pad`.
+    """
+    image = np.asarray(image)
+    if mode != 'valid':
+        pad_width = [(size, size)] * 2 + [(0, 0)] * (image.ndim - 2)
+        image = np.pad(image, pad_width, mode=mode, **pad_kwargs)
+    width = 2*size + 1
+    rows = image.shape[0] - width + 1
+    cols = image.shape[1] - width + 1
+    if rows < 1 or cols < 1:
+        raise ValueError('image of shape {} is smaller than a {}x{} window'
+                         .format(image.shape, width, width))
+    shape = (rows, cols, width, width) + image.shape[2:]
+    strides = image.strides[:2] + image.strides
+    return as_strided(image, shape=shape, strides=strides, writeable=False)
+
+
+def box_sum(image, size=1, dtype=np.float64):
+    """ Sum of each (2*size+1) x (2*size+1) window, clipped at the borders.
+
+    Computed from an integral image, so the cost does not depend on `size`.
+    """
+    image = np.asarray(image)
+    height, width = image.shape[:2]
+    integral = np.zeros((height + 1, width + 1) + image.shape[2:], dtype=dtype)
+    np.cumsum(image, axis=0, dtype=dtype, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+
+    r0 = np.clip(np.arange(height) - size, 0, height)
+    r1 = np.clip(np.arange(height) + size + 1, 0, height)
+    c0 = np.clip(np.arange(width) - size, 0, width)
+    c1 = np.clip(np.arange(width) + size + 1, 0, width)
+    return (integral[r1][:, c1] - integral[r0][:, c1]
+            - integral[r1][:, c0] + integral[r0][:, c0])
+
+
+def iter_kernel(image, size=1):
+    """ Yield position, kernel mask, and image for each pixel in the image.
+
+    The kernel mask has a 2 at the center pixel and 1 around it. The actual
+    width of the kernel is 2*size + 1.
+
+    The mask is drawn directly from the window bounds into a single buffer
+    that is reused between steps, so copy it if you need to keep it.
+    """
+    mask = np.zeros(image.shape[:2], dtype='int16')
+    previous = None
+    for (i, j), slices, subimage in iter_windows(image, size=size):
+        if previous is not None:
+            mask[previous] = 0
+        mask[slices] = 1
+        mask[i, j] = 2
+        previous = slices
+        yield (i, j), mask, subimage
+
+
+def iter_pixels(image):
+    """ Yield pixel position (row, column) and pixel intensity. """
+    height, width = image.shape[:2]
+    for i in range(height):
+        for j in range(width):
+            yield (i, j), image[i, j]
+
+
+def bounded_slice(center, xy_max, size=1, i_min=0):
+    slices = []
+    for i, i_max in zip(center, xy_max):
+        slices.append(slice(max(i - size, i_min), min(i + size + 1, i_max)))
+    return tuple(slices)
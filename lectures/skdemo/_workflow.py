@@ -0,0 +1,308 @@
+"""Lazy graphs of image operations with memoized results.
+
+Tuning a segmentation usually means re-running a notebook from the top for
+every new value of a parameter. A `Workflow` instead describes the
+operations as nodes of a graph, with their parameters and the nodes they
+take as input, and computes a node only when its value is requested::
+
+    wf = Workflow()
+    coins = wf.input('coins', data.coins())
+    edges = wf.add('edges', filters.sobel, coins)
+    ...
+    seeds = wf.add('seeds', find_seeds, distance, min_distance=7)
+    ws = wf.add('watershed', segmentation.watershed, edges, seeds)
+    labels = wf.compute(ws)
+
+    seeds.set(min_distance=10)
+    labels = wf.compute(ws)     # only 'seeds' and 'watershed' run again
+
+Results are cached under a key combining the function, its parameters and
+the keys of its input nodes, so a node is computed again only when
+something upstream of it changed. The cache is bounded in bytes; results
+evicted from it are simply computed again when needed.
+"""
+from __future__ import division
+
+import hashlib
+import time
+import uuid
+import weakref
+
+import numpy as np
+
+from ._cache import LRUCache, _function_token, _hash_value
+
+
+__all__ = ['Workflow', 'Node']
+
+
+_MISSING = object()
+
+
+# Functions keyed by identity, as their closures cannot be hashed
+_identity_tokens = weakref.WeakKeyDictionary()
+
+
+def _func_token(func):
+    name = '{}.{}'.format(getattr(func, '__module__', None),
+                          getattr(func, '__qualname__', repr(func)))
+    try:
+        return _function_token(func)
+    except AttributeError:
+        # Builtins and ufuncs have neither source nor code
+        return name
+    except TypeError:
+        # A random token rather than id(func), which a new function may reuse
+        token = _identity_tokens.get(func)
+        if token is None:
+            token = _identity_tokens[func] = '{}-{}'.format(name,
+                                                            uuid.uuid4().hex)
+        return token
+
+
+class Node(object):
+    """ Operation of a `Workflow`, created by `Workflow.add` or `input`.
+
+    Attributes
+    ----------
+    name : str
+    func : callable
+        None for input nodes.
+    args : list
+        Positional arguments of `func`; `Node` arguments are replaced by
+        their values.
+    kwargs : dict
+        Keyword-arguments of `func`, likewise.
+    seconds : float
+        Duration of the last computation of the node.
+    """
+
+    def __init__(self, workflow, name, func, args, kwargs):
+        self.workflow = workflow
+        self.name = name
+        self.func = func
+        self.args = list(args)
+        self.kwargs = dict(kwargs)
+        self.seconds = None
+        self._value = None
+        self._key = None
+
+    @property
+    def inputs(self):
+        """Nodes this node depends on directly."""
+        return [a for a in self.args + list(self.kwargs.values())
+                if isinstance(a, Node)]
+
+    @property
+    def params(self):
+        """Keyword-arguments of the node that are not nodes."""
+        return dict((k, v) for k, v in self.kwargs.items()
+                    if not isinstance(v, Node))
+
+    @property
+    def value(self):
+        """Value of an input node."""
+        if self.func is not None:
+            raise AttributeError('{!r} is not an input node; use '
+                                 'compute()'.format(self.name))
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        if self.func is not None:
+            raise AttributeError('{!r} is not an input node'
+                                 .format(self.name))
+        digest = hashlib.blake2b(digest_size=16)
+        _hash_value(digest, value, None, True)
+        self._value = value
+        self._key = digest.hexdigest()
+
+    def set(self, **params):
+        """Change keyword-arguments of the node; returns the node."""
+        if self.func is None:
+            raise TypeError('Set the value of input node {!r} instead'
+                            .format(self.name))
+        self.kwargs.update(params)
+        return self
+
+    def compute(self):
+        """Value of the node, see `Workflow.compute`."""
+        return self.workflow.compute(self)
+
+    def __getitem__(self, index):
+        """Node selecting an item of this node's value, e.g. of a tuple."""
+        name = '{}[{!r}]'.format(self.name, index)
+        if name in self.workflow:
+            return self.workflow[name]
+        return self.workflow.add(name, _getitem, self, index)
+
+    def __repr__(self):
+        if self.func is None:
+            return 'Node({!r}, input)'.format(self.name)
+        return 'Node({!r}, {}, inputs={}, params={})'.format(
+            self.name, getattr(self.func, '__name__', self.func),
+            [n.name for n in self.inputs], self.params)
+
+
+def _getitem(value, index):
+    return value[index]
+
+
+class Workflow(object):
+    """ Graph of lazily computed operations with a bounded result cache.
+
+    Parameters
+    ----------
+    cache_bytes : int or None
+        Memory budget of the cached results (arrays, possibly in tuples or
+        lists; other values are not counted).
+
+    Attributes
+    ----------
+    computed : list of str
+        Names of the nodes computed by the last `compute` call, in order.
+    cache : `LRUCache`
+        Results, by node key.
+
+    Notes
+    -----
+    Cached arrays are returned read-only, since they are shared by every
+    node and call using them: functions must not modify their inputs in
+    place. Input values are hashed in full when set; assign the `value` of
+    an input node again after modifying the array in place. Functions are
+    keyed by their source and the values they close over, or by identity
+    if these values cannot be hashed.
+    """
+
+    def __init__(self, cache_bytes=512 * 2**20):
+        self.nodes = {}
+        self.cache = LRUCache(maxsize=None, maxbytes=cache_bytes)
+        self.computed = []
+
+    def __contains__(self, name):
+        return name in self.nodes
+
+    def __getitem__(self, name):
+        return self.nodes[name]
+
+    def __iter__(self):
+        return iter(self.nodes.values())
+
+    def _new_node(self, name, func, args, kwargs):
+        if name in self.nodes:
+            raise ValueError('The workflow already has a node {!r}'
+                             .format(name))
+        for value in list(args) + list(kwargs.values()):
+            if isinstance(value, Node) and value.workflow is not self:
+                raise ValueError('Node {!r} belongs to another workflow'
+                                 .format(value.name))
+        node = self.nodes[name] = Node(self, name, func, args, kwargs)
+        return node
+
+    def input(self, name, value):
+        """Input node holding `value`."""
+        node = self._new_node(name, None, (), {})
+        node.value = value
+        return node
+
+    def add(self, name, func, *args, **kwargs):
+        """ Node computing ``func(*args, **kwargs)``.
+
+        Arguments that are nodes (at the top level, not inside containers)
+        are replaced by their values when the node is computed.
+        """
+        return self._new_node(name, func, args, kwargs)
+
+    def key(self, node, _keys=None):
+        """Cache key of `node`: its function, parameters and input keys."""
+        node = self._node(node)
+        if node.func is None:
+            return node._key
+        keys = {} if _keys is None else _keys
+        if node.name not in keys:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(_func_token(node.func).encode())
+            arguments = list(enumerate(node.args)) + sorted(
+                node.kwargs.items())
+            for position, value in arguments:
+                digest.update(repr(position).encode())
+                if isinstance(value, Node):
+                    digest.update(b'node:')
+                    digest.update(self.key(value, keys).encode())
+                elif callable(value) and not isinstance(value, type):
+                    digest.update(b'func:')
+                    digest.update(_func_token(value).encode())
+                else:
+                    _hash_value(digest, value, None, True)
+            keys[node.name] = digest.hexdigest()
+        return keys[node.name]
+
+    def _node(self, node):
+        if isinstance(node, Node):
+            if node.workflow is not self:
+                raise ValueError('Node {!r} belongs to another workflow'
+                                 .format(node.name))
+            return node
+        return self.nodes[node]
+
+    def compute(self, *nodes):
+        """ Values of `nodes` (nodes or names), computing what is needed.
+
+        Returns a single value for a single node, else a tuple.
+        """
+        self.computed = []
+        keys = {}
+        values = {}
+        results = tuple(self._evaluate(self._node(node), keys, values)
+                        for node in nodes)
+        return results[0] if len(results) == 1 else results
+
+    def _evaluate(self, node, keys, values):
+        if node.func is None:
+            return node.value
+        key = self.key(node, keys)
+        if key in values:
+            return values[key]
+        value = self.cache.get(key, _MISSING)
+        if value is _MISSING:
+            args = [self._evaluate(a, keys, values) if isinstance(a, Node)
+                    else a for a in node.args]
+            kwargs = dict((k, self._evaluate(v, keys, values)
+                           if isinstance(v, Node) else v)
+                          for k, v in node.kwargs.items())
+            start = time.perf_counter()
+            value = node.func(*args, **kwargs)
+            node.seconds = time.perf_counter() - start
+            if isinstance(value, np.ndarray) and value.flags.owndata:
+                value.setflags(write=False)
+            self.cache[key] = value
+            self.computed.append(node.name)
+        # Keep the values of this call even if the cache evicts them
+        values[key] = value
+        return value
+
+    def invalidate(self, *nodes):
+        """Drop the cached results of `nodes`, by default of all nodes."""
+        if not nodes:
+            self.cache.clear()
+            return
+        for node in nodes:
+            self.cache.pop(self.key(node))
+
+    def report(self):
+        """Text table of the nodes, their inputs, cache state and timing."""
+        header = '{:<20} {:<30} {:>7} {:>10}'.format('node', 'inputs',
+                                                      'cached', 'last [s]')
+        lines = [header, '-' * len(header)]
+        keys = {}
+        for node in self.nodes.values():
+            if node.func is None:
+                cached, seconds = 'input', ''
+            else:
+                cached = 'yes' if self.key(node, keys) in self.cache else 'no'
+                seconds = ('{:.4f}'.format(node.seconds)
+                           if node.seconds is not None else '')
+            lines.append('{:<20} {:<30} {:>7} {:>10}'.format(
+                node.name, ', '.join(n.name for n in node.inputs), cached,
+                seconds))
+        return '\n'.join(lines)
@@ -0,0 +1,38 @@
+"""Decode an image directory into a packed, memory-mapped image store.
+
+    python utils/pack_images.py images/
+
+Only images whose file changed since the last run are decoded again. Load
+the images with ``skdemo.ImageStore('../images')['Bells-Beach.jpg']``.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'lectures'))
+
+import skdemo                 # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Pack the images of a directory into an image store.')
+    parser.add_argument('source', help='image directory')
+    parser.add_argument('--store', help='store directory (default: '
+                                        '<source>/.imagestore)')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    store = skdemo.build_image_store(args.source, args.store,
+                                     verbose=not args.quiet)
+    nbytes = sum(store[name].nbytes for name in store)
+    print('{} images, {:.1f} MB in {}'.format(len(store), nbytes / 2**20,
+                                              store.directory))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,608 @@
+"""Run a `lectures-py` export headless, with per-cell timing and caching.
+
+The exported lectures are split into cells at their ``# <codecell>``
+markers. IPython magics are translated (``%time stmt`` and ``%timeit stmt``
+run the statement once, ``%precision`` sets the NumPy print precision;
+magics on the right of an assignment go through a minimal ``get_ipython()``)
+or stripped (``%matplotlib``, extension loading, ``%load_style``, help
+requests such as ``ndi.convolve?``, shell escapes and cell magics such as
+``%%bash``), and the cells are executed in one
+namespace with the Agg backend, from the `lectures` directory so that
+relative paths and ``import skdemo`` work as in the notebooks.
+
+Each cell is keyed by its source and the key of the cell before it. Its
+output, figures, wall time and peak memory are cached under that key,
+together with the namespace it leaves behind. On the next run, cells up to
+the first changed one are replayed from the cache and execution resumes
+from there::
+
+    python utils/run_lecture.py lectures-py/1_image_filters.py
+    # edit a cell near the end, then only the cells from it onward run:
+    python utils/run_lecture.py lectures-py/1_image_filters.py
+
+The namespace is saved value by value (NumPy arrays, numbers, ... with
+pickle, modules by name, functions defined in the lecture by their code);
+figures, axes and other artists are left out. When a cell leaves something
+behind that cannot be saved, e.g. an instance of a class defined in the
+lecture, the run resumes from the last cell whose namespace could be saved
+instead. State outside the namespace (files written, library settings
+changed by a cell) is not restored. Only the cells of the latest version
+of a lecture are kept in its cache.
+"""
+from __future__ import division, print_function
+
+import argparse
+import ast
+import hashlib
+import io
+import json
+import marshal
+import os
+import pickle
+import re
+import shutil
+import sys
+import time
+import traceback
+import types
+from collections import OrderedDict, namedtuple
+from contextlib import redirect_stderr, redirect_stdout
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(ROOT, 'lectures'))
+
+import skdemo                 # noqa: E402
+from skdemo._cache import array_fingerprint  # noqa: E402
+
+
+# Bump when the cache layout or the translation changes
+CACHE_VERSION = '2'
+
+Cell = namedtuple('Cell', ['index', 'lineno', 'source'])
+
+_CELL_MARKER = re.compile(r'^# <(code|markdown)cell>\s*$')
+
+# Line magics without an effect on a headless run
+_IGNORED_MAGICS = {'matplotlib', 'pylab', 'load_ext', 'reload_ext',
+                   'unload_ext', 'autoreload', 'aimport', 'load_style',
+                   'config', 'notebook', 'qtconsole'}
+
+# Cell magics whose body is Python code run once
+_PYTHON_CELL_MAGICS = {'time', 'timeit', 'capture', 'prun'}
+
+_TIMEIT_OPTIONS = re.compile(r'^(-[a-z](\s*\d+)?\s+)*', re.IGNORECASE)
+
+# ``obj?``, ``obj??`` and ``?obj`` (with ``*`` wildcards) show help
+_HELP_REQUEST = re.compile(r'^(\?\??[\w.*]+|[\w.*]+\?\??)$')
+
+# ``target = %magic args``
+_ASSIGNED_MAGIC = re.compile(r'^(?P<target>[\w.,\s\[\]()*]+?=)\s*'
+                             r'%(?P<name>\w+)\s*(?P<arg>.*)$')
+
+class HeadlessShell(object):
+    """ Stand-in for ``get_ipython()`` in headless runs.
+
+    Only `run_line_magic` is provided, with the translations of
+    `translate`: ``%time`` returns the value of its statement and
+    ``%timeit`` the attributes of IPython's ``TimeitResult`` for a single
+    run (a `types.SimpleNamespace`, so that it can be cached).
+    """
+
+    def __init__(self, user_ns):
+        self.user_ns = user_ns
+
+    def run_line_magic(self, name, line):
+        if name in ('time', 'timeit'):
+            statement = _TIMEIT_OPTIONS.sub('', line.strip())
+            try:
+                code, value = compile(statement, '<magic>', 'eval'), True
+            except SyntaxError:
+                code, value = compile(statement, '<magic>', 'exec'), False
+            start = time.perf_counter()
+            result = (eval if value else exec)(code, self.user_ns)
+            seconds = time.perf_counter() - start
+            if name == 'time':
+                return result
+            return types.SimpleNamespace(
+                loops=1, repeat=1, best=seconds, worst=seconds,
+                all_runs=[seconds], compile_time=0., average=seconds,
+                stdev=0.)
+        if name == 'precision':
+            np.set_printoptions(precision=int(line or 8))
+        return None
+
+
+def parse_cells(path):
+    """ Split an exported lecture into its code cells.
+
+    Returns
+    -------
+    cells : list of `Cell`
+        Code cells with their index and first line number (1-based).
+    """
+    with io.open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    cells = []
+    kind, start, body = None, 0, []
+
+    def close():
+        if kind == 'code' and ''.join(body).strip():
+            cells.append(Cell(len(cells), start + 1, '\n'.join(body)))
+
+    for lineno, line in enumerate(lines):
+        match = _CELL_MARKER.match(line)
+        if match:
+            close()
+            kind, start, body = match.group(1), lineno + 1, []
+        else:
+            body.append(line)
+    close()
+    return cells
+
+
+def translate(source):
+    """ Turn the source of a cell into plain Python.
+
+    Returns
+    -------
+    code : str or None
+        Python source, with the same number of lines, or None if the cell
+        cannot run headless (e.g. a ``%%bash`` cell).
+    notes : list of str
+        What was stripped.
+    """
+    lines = source.split('\n')
+    notes = []
+    first = next((i for i, line in enumerate(lines) if line.strip()), 0)
+    if lines[first].startswith('%%'):
+        magic = lines[first][2:].split(None, 1)[0]
+        if magic not in _PYTHON_CELL_MAGICS:
+            return None, ['cell magic %%{} not run'.format(magic)]
+        lines[first] = ''
+
+    out = []
+    for line in lines:
+        stripped = line.lstrip()
+        indent = line[:len(line) - len(stripped)]
+        assigned = _ASSIGNED_MAGIC.match(stripped)
+        if stripped.startswith('!'):
+            notes.append('shell command stripped: {}'.format(stripped))
+            line = indent + 'pass'
+        elif _HELP_REQUEST.match(stripped.rstrip()):
+            notes.append('help request stripped: {}'.format(stripped.rstrip()))
+            line = indent + 'pass'
+        elif assigned:
+            line = '{}{} get_ipython().run_line_magic({!r}, {!r})'.format(
+                indent, assigned.group('target'), assigned.group('name'),
+                assigned.group('arg').strip())
+        elif stripped.startswith('%'):
+            name, _, arg = stripped[1:].partition(' ')
+            arg = arg.strip()
+            if name in ('time', 'timeit'):
+                line = indent + _TIMEIT_OPTIONS.sub('', arg)
+            elif name == 'precision':
+                line = indent + ("__import__('numpy').set_printoptions("
+                                 "precision={})".format(arg or 8))
+            else:
+                if name not in _IGNORED_MAGICS:
+                    notes.append('magic stripped: {}'.format(stripped))
+                line = indent + 'pass'
+        elif stripped.startswith('from __future__ import'):
+            # No-ops on Python 3, and only legal at the top of a file
+            line = indent + 'pass'
+        out.append(line)
+    return '\n'.join(out), notes
+
+
+def _chain_key(previous, text):
+    return hashlib.blake2b((previous + '\0' + text).encode('utf-8'),
+                           digest_size=16).hexdigest()
+
+
+class CellCache(object):
+    """ Content-addressed store of cell records and namespace values.
+
+    ``cells/<key>.json`` holds the record of a cell; values and figures are
+    stored once in ``objects/<hash>``, however many cells refer to them.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._cells = os.path.join(directory, 'cells')
+        self._objects = os.path.join(directory, 'objects')
+        for path in (self._cells, self._objects):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.__init__(self.directory)
+
+    def get_record(self, key):
+        path = os.path.join(self._cells, key + '.json')
+        if not os.path.exists(path):
+            return None
+        with io.open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def put_record(self, key, record):
+        path = os.path.join(self._cells, key + '.json')
+        with io.open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(json.dumps(record, indent=1))
+        os.replace(path + '.tmp', path)
+
+    def put_bytes(self, data):
+        digest = hashlib.blake2b(data, digest_size=20).hexdigest()
+        path = os.path.join(self._objects, digest)
+        if not os.path.exists(path):
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+        return digest
+
+    def get_bytes(self, digest):
+        with open(os.path.join(self._objects, digest), 'rb') as f:
+            return f.read()
+
+    def prune(self, keys):
+        """Delete the records not in `keys` and unreferenced objects."""
+        keys = set(keys)
+        used = set()
+        for filename in os.listdir(self._cells):
+            key = filename[:-len('.json')]
+            if key not in keys:
+                os.remove(os.path.join(self._cells, filename))
+                continue
+            record = self.get_record(key)
+            used.update(record['figures'])
+            for kind, ref in (record['state'] or {}).values():
+                if kind != 'module':
+                    used.add(ref)
+        for digest in os.listdir(self._objects):
+            if digest not in used:
+                os.remove(os.path.join(self._objects, digest))
+
+
+def _is_lecture_function(value, namespace):
+    return (isinstance(value, types.FunctionType)
+            and value.__globals__ is namespace)
+
+
+def _is_artist(value):
+    """Whether `value` is a matplotlib artist, or a container of them."""
+    from matplotlib.artist import Artist
+
+    if isinstance(value, Artist):
+        return True
+    if isinstance(value, np.ndarray) and value.dtype == object:
+        items = value.ravel()
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        return False
+    return len(items) > 0 and all(_is_artist(item) for item in items)
+
+
+def save_namespace(namespace, cache, memo=None):
+    """ Store the namespace of a run in `cache`, value by value.
+
+    `memo` is a dict kept between the cells of a run: NumPy arrays whose
+    content did not change since they were last stored are not pickled
+    again.
+
+    Returns
+    -------
+    state : dict or None
+        Name -> (kind, reference) entries, or None if some value could not
+        be saved.
+    """
+    state = {}
+    for name, value in namespace.items():
+        if name.startswith('__') and name.endswith('__'):
+            continue
+        if isinstance(value, types.ModuleType):
+            state[name] = ('module', value.__name__)
+        elif _is_artist(value):
+            # Figures are closed after their cell, as with the inline
+            # backend: they are not part of the saved state.
+            continue
+        elif _is_lecture_function(value, namespace):
+            if value.__closure__:
+                return None
+            data = pickle.dumps((marshal.dumps(value.__code__), value.__name__,
+                                 value.__defaults__, value.__kwdefaults__,
+                                 value.__doc__), protocol=4)
+            state[name] = ('function', cache.put_bytes(data))
+        elif getattr(type(value), '__module__', None) == '__main__' or \
+                getattr(value, '__module__', None) == '__main__':
+            # Classes defined in the lecture, and their instances
+            return None
+        elif type(value) is np.ndarray and value.dtype != object:
+            fingerprint = array_fingerprint(value, full=True)
+            stored = memo.get(id(value)) if memo is not None else None
+            if stored is None or stored[1] != fingerprint:
+                digest = cache.put_bytes(pickle.dumps(value, protocol=4))
+                # Holding the array keeps its id from being reused
+                stored = (value, fingerprint, digest)
+                if memo is not None:
+                    memo[id(value)] = stored
+            state[name] = ('pickle', stored[2])
+        else:
+            try:
+                data = pickle.dumps(value, protocol=4)
+            except Exception:
+                return None
+            state[name] = ('pickle', cache.put_bytes(data))
+    return state
+
+
+def load_namespace(state, cache, namespace):
+    """Rebuild the values saved by `save_namespace` into `namespace`."""
+    import importlib
+
+    functions = []
+    for name, (kind, ref) in state.items():
+        if kind == 'module':
+            namespace[name] = importlib.import_module(ref)
+        elif kind == 'pickle':
+            namespace[name] = pickle.loads(cache.get_bytes(ref))
+        else:
+            functions.append((name, ref))
+    for name, ref in functions:
+        code, fname, defaults, kwdefaults, doc = pickle.loads(
+            cache.get_bytes(ref))
+        func = types.FunctionType(marshal.loads(code), namespace, fname,
+                                  defaults)
+        func.__kwdefaults__ = kwdefaults
+        func.__doc__ = doc
+        namespace[name] = func
+
+
+class _Tee(io.StringIO):
+    """Text buffer also echoing to a stream."""
+
+    def __init__(self, stream=None):
+        io.StringIO.__init__(self)
+        self._stream = stream
+
+    def write(self, text):
+        if self._stream is not None:
+            self._stream.write(text)
+        return io.StringIO.write(self, text)
+
+
+def _exec_cell(code, filename, namespace):
+    """Execute `code`, printing the value of a final expression."""
+    tree = ast.parse(code, filename, 'exec')
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+    exec(compile(tree, filename, 'exec'), namespace)
+    if last is not None:
+        value = eval(compile(last, filename, 'eval'), namespace)
+        if value is not None:
+            print(repr(value))
+
+
+def _collect_figures(cache, dpi):
+    """Save the open pyplot figures to the cache and close them."""
+    if 'matplotlib.pyplot' not in sys.modules:
+        return []
+    plt = sys.modules['matplotlib.pyplot']
+    figures = []
+    for num in plt.get_fignums():
+        buf = io.BytesIO()
+        plt.figure(num).savefig(buf, format='png', dpi=dpi)
+        figures.append(cache.put_bytes(buf.getvalue()))
+    # As with the inline backend, figures do not outlive their cell
+    plt.close('all')
+    return figures
+
+
+def run_lecture(path, cache_dir=None, workdir=None, use_cache=True,
+                memory=True, keep_going=False, echo=True, dpi=72):
+    """ Execute the code cells of an exported lecture.
+
+    Parameters
+    ----------
+    path : str
+        Lecture exported as Python (``lectures-py/*.py``).
+    cache_dir : str
+        Directory of the cell cache, by default ``.lecture_cache/<name>``
+        next to the lecture.
+    workdir : str
+        Working directory of the run, by default ``lectures``.
+    use_cache : bool
+        Replay unchanged cells from the cache and store new results.
+    memory : bool
+        Trace the peak memory of each cell (slows allocations down).
+    keep_going : bool
+        Continue after a cell raised an exception.
+    echo : bool
+        Print cell output while running.
+
+    Returns
+    -------
+    records : list of dict
+        Per-cell records: `status` is 'cached', 'ran', 'skipped' or
+        'error', with the wall time, peak memory, output and figures.
+    """
+    path = os.path.abspath(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(path), '.lecture_cache',
+                                 name)
+    if workdir is None:
+        workdir = os.path.join(ROOT, 'lectures')
+    cache = CellCache(cache_dir)
+
+    cells = parse_cells(path)
+    translated = [translate(cell.source) for cell in cells]
+    keys = []
+    key = _chain_key(CACHE_VERSION, os.path.abspath(workdir))
+    for code, notes in translated:
+        key = _chain_key(key, code if code is not None else '')
+        keys.append(key)
+
+    # Replay the longest cached prefix, up to its last restorable cell
+    cached = []
+    if use_cache:
+        for key in keys:
+            record = cache.get_record(key)
+            if record is None:
+                break
+            cached.append(record)
+    resume = 0
+    for i, record in enumerate(cached):
+        if record['state'] is not None:
+            resume = i + 1
+
+    # As in IPython, `get_ipython` is a builtin: it is not saved with the
+    # namespace
+    builtins = dict(vars(__import__('builtins')))
+    namespace = {'__name__': '__main__', '__builtins__': builtins}
+    shell = HeadlessShell(namespace)
+    builtins['get_ipython'] = lambda: shell
+    records = []
+    previous_cwd = os.getcwd()
+    memo = {}
+    os.chdir(workdir)
+    try:
+        if resume:
+            load_namespace(cached[resume - 1]['state'], cache, namespace)
+        for cell, (code, notes), key in zip(cells, translated, keys):
+            if cell.index < resume:
+                record = dict(cached[cell.index], status='cached')
+                if echo and record['output']:
+                    sys.stdout.write(record['output'])
+                records.append(record)
+                continue
+
+            record = OrderedDict([('index', cell.index),
+                                  ('lineno', cell.lineno),
+                                  ('notes', notes), ('output', ''),
+                                  ('figures', []), ('wall_s', 0.),
+                                  ('peak_bytes', 0), ('state', None)])
+            if code is None:
+                record['status'] = 'skipped'
+            else:
+                output = _Tee(sys.stdout if echo else None)
+                stage = 'cell {}'.format(cell.index)
+                filename = '{}:{}'.format(path, cell.lineno)
+                # Memory is only traced while a cell runs, so that its
+                # snapshots do not hold every allocation of earlier cells
+                skdemo.reset_profile()
+                skdemo.enable_profiling(memory=memory)
+                try:
+                    with redirect_stdout(output), redirect_stderr(output), \
+                            skdemo.profile(stage):
+                        _exec_cell(code, filename, namespace)
+                    record['status'] = 'ran'
+                except Exception:
+                    traceback.print_exc(file=output)
+                    record['status'] = 'error'
+                finally:
+                    skdemo.disable_profiling()
+                stats = [r for r in skdemo.profile_report('records')
+                         if r['stage'] == stage][0]
+                record['wall_s'] = stats['wall_s']
+                record['peak_bytes'] = stats['peak_bytes']
+                record['output'] = output.getvalue()
+                record['figures'] = _collect_figures(cache, dpi)
+            records.append(record)
+
+            if record['status'] == 'error':
+                if not keep_going:
+                    break
+                continue
+            if use_cache:
+                record['state'] = save_namespace(namespace, cache, memo)
+                cache.put_record(key, record)
+    finally:
+        skdemo.reset_profile()
+        os.chdir(previous_cwd)
+    if use_cache:
+        cache.prune(keys)
+    return records
+
+
+def format_report(records):
+    header = '{:>5} {:>6} {:>8} {:>10} {:>10} {:>5}  {}'.format(
+        'cell', 'line', 'status', 'wall [s]', 'peak [MB]', 'figs', 'notes')
+    lines = [header, '-' * len(header)]
+    total = 0.
+    for r in records:
+        total += r['wall_s'] if r['status'] != 'cached' else 0.
+        lines.append('{:>5} {:>6} {:>8} {:>10.3f} {:>10.1f} {:>5}  {}'.format(
+            r['index'], r['lineno'], r['status'], r['wall_s'],
+            r['peak_bytes'] / 2**20, len(r['figures']),
+            '; '.join(r['notes'])))
+    ran = sum(r['status'] in ('ran', 'error') for r in records)
+    lines.append('{} of {} cells executed in {:.2f} s'.format(
+        ran, len(records), total))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run an exported lecture headless.')
+    parser.add_argument('lecture', help='lecture exported as Python')
+    parser.add_argument('--cache-dir', help='cell cache directory')
+    parser.add_argument('--workdir', help='working directory of the run '
+                                          '(default: lectures/)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='run every cell and do not store results')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='empty the cell cache before running')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='do not trace memory')
+    parser.add_argument('--keep-going', action='store_true',
+                        help='run the remaining cells after an error')
+    parser.add_argument('--figures', metavar='DIR',
+                        help='write the figures of all cells to DIR')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write the per-cell records to FILE')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not print cell output')
+    args = parser.parse_args(argv)
+
+    lecture = os.path.abspath(args.lecture)
+    name = os.path.splitext(os.path.basename(lecture))[0]
+    cache_dir = args.cache_dir or os.path.join(
+        os.path.dirname(lecture), '.lecture_cache', name)
+    if args.clear_cache:
+        CellCache(cache_dir).clear()
+
+    records = run_lecture(lecture, cache_dir=cache_dir,
+                          workdir=args.workdir, use_cache=not args.no_cache,
+                          memory=not args.no_memory,
+                          keep_going=args.keep_going, echo=not args.quiet)
+
+    if args.figures:
+        cache = CellCache(cache_dir)
+        if not os.path.isdir(args.figures):
+            os.makedirs(args.figures)
+        for r in records:
+            for k, digest in enumerate(r['figures']):
+                filename = os.path.join(args.figures, '{}_cell{:03d}_{}.png'
+                                        .format(name, r['index'], k))
+                with open(filename, 'wb') as f:
+                    f.write(cache.get_bytes(digest))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([OrderedDict((k, v) for k, v in r.items()
+                                   if k != 'state') for r in records],
+                      f, indent=2)
+
+    print()
+    print(format_report(records))
+    return int(any(r['status'] == 'error' for r in records))
+
+
+if __name__ == '__main__':
+    sys.exit(main())